@@ -0,0 +1,55 @@
+"""Per-frame cost of the audio sources the player thread reads every 20ms."""
+from benchmarks.fakes import FakePCMSource
+from benchmarks.harness import measure
+from utils.audio import FRAME_LENGTH, FrameCounter, RampingVolume, TrackMixer
+
+FRAMES = 1000
+
+
+def track(sample=1000):
+    return FrameCounter(RampingVolume(FakePCMSource(FRAMES * 2, sample), 0.5))
+
+
+def read_frames(mixer):
+    for _ in range(FRAMES):
+        mixer.read()
+
+
+def run(loop, sizes):
+    results = []
+    results.append(
+        measure(
+            "audio.mixer.read",
+            read_frames,
+            params={"frames": FRAMES},
+            setup=lambda: TrackMixer(track()),
+        )
+    )
+
+    def crossfading():
+        mixer = TrackMixer(track())
+        # long enough that every timed frame is mixed
+        mixer.queue(track(-1000), FRAMES * 2 * FRAME_LENGTH, fade_at=0)
+        return mixer
+
+    results.append(
+        measure(
+            "audio.mixer.read_crossfade",
+            read_frames,
+            params={"frames": FRAMES},
+            setup=crossfading,
+        )
+    )
+
+    def handoffs():
+        # a switch every other frame
+        mixer = TrackMixer(FrameCounter(FakePCMSource(1)))
+        for _ in range(FRAMES):
+            mixer.read()
+            mixer.queue(FrameCounter(FakePCMSource(2)))
+            mixer.read()
+
+    results.append(
+        measure("audio.mixer.handoff", handoffs, params={"switches": FRAMES})
+    )
+    return results
@@ -0,0 +1,96 @@
+"""GuildQueue operations and queue page rendering on big queues."""
+import asyncio
+
+from benchmarks.fakes import fake_context, fake_entry, fake_member
+from benchmarks.harness import measure
+from cogs.music import queue_page, queue_page_count
+from utils.queue import GuildQueue
+from utils.track import QueuedTrack
+
+
+def make_tracks(size):
+    requester = fake_member()
+    return [
+        QueuedTrack(data=entry, requester=requester, web_url=entry["url"])
+        for entry in map(fake_entry, range(size))
+    ]
+
+
+def run(loop, sizes):
+    ctx = fake_context(loop)
+    results = []
+    # kept alive until their (never started) player loops are cancelled
+    queues = []
+
+    def new_queue():
+        queues.append(GuildQueue(ctx))
+        return queues[-1]
+
+    for size in sizes:
+        tracks = make_tracks(size)
+        params = {"tracks": size}
+
+        def filled():
+            queue = new_queue()
+            for track in tracks:
+                queue.queue.put_nowait(track)
+            return queue
+
+        def add_all(queue):
+            for track in tracks:
+                loop.run_until_complete(queue.add(track))
+
+        def get_all(queue):
+            for _ in range(size):
+                loop.run_until_complete(queue.get_next())
+
+        results.append(
+            measure("queue.add_all", add_all, params=params, repeat=3, setup=new_queue)
+        )
+        results.append(
+            measure(
+                "queue.get_next_all", get_all, params=params, repeat=3, setup=filled
+            )
+        )
+
+        queue = filled()
+        results.append(measure("queue.shuffle", queue.shuffle, params=params))
+        results.append(
+            measure("queue.peek_next", queue.peek_next, params=params, number=10000)
+        )
+        results.append(
+            measure(
+                "queue.insert_front",
+                lambda: queue.queue.insert(0, tracks[0]),
+                params=params,
+                number=1000,
+            )
+        )
+        results.append(
+            measure(
+                "queue.remove_front",
+                lambda: queue.queue.remove(0),
+                params=params,
+                number=1000,
+            )
+        )
+
+        lastPage = queue_page_count(queue) - 1
+        for label, page in (
+            ("first", 0),
+            ("middle", lastPage // 2),
+            ("last", lastPage),
+        ):
+            results.append(
+                measure(
+                    f"queue.page_render.{label}",
+                    lambda: queue_page(queue, page),
+                    params=params,
+                    number=200,
+                )
+            )
+
+    for queue in queues:
+        queue.task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    return results
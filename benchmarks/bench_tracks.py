@@ -0,0 +1,76 @@
+"""QueuedTrack construction from playlists, embeds, and memory per queued track."""
+from itertools import count
+
+from benchmarks.fakes import fake_context, fake_entry, fake_member, fake_processed
+from benchmarks.harness import measure, measure_memory
+from utils.track import ActiveTrack, QueuedTrack, StreamInfo
+
+_unique = count()
+
+
+def run(loop, sizes):
+    ctx = fake_context(loop)
+    results = []
+
+    for size in sizes:
+
+        def from_url(url=None):
+            # a new URL each time, so it's extracted rather than answered by the cache
+            url = url or f"https://bench.invalid/playlist/{size}?run={next(_unique)}"
+            return loop.run_until_complete(QueuedTrack.from_url(ctx, url, loop=loop))
+
+        results.append(
+            measure(
+                "track.from_url.playlist", from_url, params={"tracks": size}, repeat=3
+            )
+        )
+        cachedUrl = f"https://bench.invalid/playlist/{size}?run=cached"
+        from_url(cachedUrl)
+        results.append(
+            measure(
+                "track.from_url.playlist_cached",
+                lambda: from_url(cachedUrl),
+                params={"tracks": size},
+                repeat=3,
+            )
+        )
+
+    track = QueuedTrack(
+        data=fake_entry(1), requester=fake_member(), web_url=fake_entry(1)["url"]
+    )
+    results.append(measure("track.to_embed", track.to_embed, number=1000))
+    results.append(
+        measure("track.to_embed.playing", lambda: track.to_embed(90, True), number=1000)
+    )
+
+    requester = fake_member()
+    memorySize = max(sizes)
+    results.append(
+        measure_memory(
+            "memory.queued_track",
+            lambda: [
+                QueuedTrack(data=entry, requester=requester, web_url=entry["url"])
+                for entry in (fake_entry(i) for i in range(memorySize))
+            ],
+            memorySize,
+        )
+    )
+
+    def active_tracks():
+        tracks = []
+        for i in range(memorySize // 10):
+            data = fake_processed(fake_entry(i))
+            tracks.append(
+                ActiveTrack(
+                    StreamInfo(data),
+                    data=data,
+                    requester=requester,
+                    web_url=data["webpage_url"],
+                )
+            )
+        return tracks
+
+    results.append(
+        measure_memory("memory.active_track", active_tracks, memorySize // 10)
+    )
+    return results
@@ -0,0 +1,188 @@
+"""Stand-ins for yt-dlp and Discord, so the benchmarks run offline and deterministically."""
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import discord
+
+from utils.track import extractionPool
+
+
+def fake_entry(i: int) -> dict:
+    """A flat playlist entry shaped like yt-dlp's YouTube ones."""
+    videoId = f"{i:011d}"
+    return {
+        "_type": "url",
+        "ie_key": "Youtube",
+        "id": videoId,
+        "url": f"https://www.youtube.com/watch?v={videoId}",
+        "title": f"Benchmark track number {i} (Official Audio)",
+        "description": None,
+        "duration": 180 + i % 240,
+        "channel_id": "UC0000000000000000000000",
+        "channel": "Benchmark Channel",
+        "channel_url": "https://www.youtube.com/channel/UC0000000000000000000000",
+        "thumbnails": [
+            {
+                "url": f"https://i.ytimg.com/vi/{videoId}/hqdefault.jpg",
+                "height": 360,
+                "width": 480,
+            }
+        ],
+        "thumbnail": f"https://i.ytimg.com/vi/{videoId}/hqdefault.jpg",
+        "view_count": i * 1000,
+        "live_status": None,
+    }
+
+
+def fake_processed(entry: dict) -> dict:
+    """Full info for an entry, with the formats and thumbnails a real YouTube video has."""
+    # a track that dropped its info only has its page URL
+    videoId = entry.get("id") or entry["url"].rsplit("=", 1)[1]
+    formats = [
+        {
+            "format_id": str(100 + i),
+            "url": f"https://bench.invalid/videoplayback?id={videoId}&itag={100 + i}"
+            + "&sig="
+            + "x" * 200,
+            "ext": "webm" if i % 2 else "mp4",
+            "acodec": "opus" if i % 2 else "mp4a.40.2",
+            "vcodec": "none" if i < 4 else "vp9",
+            "abr": 48 + i * 16,
+            "filesize": 3_000_000 + i,
+            "http_headers": {"User-Agent": "Mozilla/5.0", "Accept": "*/*"},
+            "protocol": "https",
+        }
+        for i in range(24)
+    ]
+    return dict(
+        entry,
+        id=videoId,
+        _type="video",
+        webpage_url=entry["url"],
+        formats=formats,
+        thumbnails=[
+            {"url": f"https://i.ytimg.com/vi/{videoId}/{i}.jpg", "id": str(i)}
+            for i in range(40)
+        ],
+        tags=[f"tag {i}" for i in range(20)],
+        description="A benchmark track. " * 50,
+        url=formats[1]["url"],
+        acodec="opus",
+        ext="webm",
+        http_headers=formats[1]["http_headers"],
+    )
+
+
+class FakeYoutubeDL:
+    def __init__(self, options=None):
+        """Answers extract_info like YoutubeDL with process=False, without the network.
+
+        URLs like https://bench.invalid/playlist/N are playlists of N entries, paged lazily like
+        yt-dlp's; anything else is a single video.
+        """
+        self.options = options
+
+    def extract_info(self, url, download=False, process=True, **kwargs):
+        if "/playlist/" in url:
+            count = int(url.rsplit("/", 1)[1].split("?")[0])
+            return {
+                "_type": "playlist",
+                "id": url,
+                "title": f"Benchmark playlist of {count}",
+                "webpage_url": url,
+                "playlist_count": count,
+                "entries": (fake_entry(i) for i in range(count)),
+            }
+        return dict(fake_entry(0), _type="video", webpage_url=url)
+
+    def process_ie_result(self, data, download=False, **kwargs):
+        return fake_processed(data)
+
+
+def install():
+    """Make the extraction pool's workers use FakeYoutubeDL. Call before anything's extracted."""
+    extractionPool.factory = FakeYoutubeDL
+
+
+class FakePCMSource(discord.AudioSource):
+    def __init__(self, frames: int, sample: int = 1000):
+        """frames 20ms frames of constant PCM, like FFmpegPCMAudio with nothing to wait for."""
+        self.frames = frames
+        self.frame = sample.to_bytes(2, "little", signed=True) * (
+            discord.opus.Encoder.FRAME_SIZE // 2
+        )
+
+    def read(self):
+        if self.frames <= 0:
+            return b""
+        self.frames -= 1
+        return self.frame
+
+    def cleanup(self):
+        self.frames = 0
+
+
+class FakeVoiceClient:
+    def __init__(self):
+        self.channel = SimpleNamespace(id=2, members=[])
+        self.source = None
+
+    def play(self, source, after=None):
+        self.source = source
+
+    def stop(self):
+        self.source = None
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def is_playing(self):
+        return self.source is not None
+
+    def is_paused(self):
+        return False
+
+    def is_connected(self):
+        return True
+
+
+class FakeBot:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.config = {}
+        self.logger = logging.getLogger("benchmarks")
+
+    async def wait_until_ready(self):
+        # player loops never start; benchmarks drive queues directly
+        await asyncio.Event().wait()
+
+    def is_closed(self):
+        return False
+
+
+def fake_member(memberId: int = 1):
+    return SimpleNamespace(
+        id=memberId,
+        display_name="Benchmark User",
+        mention=f"<@{memberId}>",
+        bot=False,
+        display_avatar=SimpleNamespace(
+            url="https://cdn.discordapp.com/embed/avatars/0.png"
+        ),
+    )
+
+
+def fake_context(loop: asyncio.AbstractEventLoop):
+    """Enough of a command context for QueuedTrack and GuildQueue."""
+    guild = SimpleNamespace(id=1, voice_client=FakeVoiceClient())
+    return SimpleNamespace(
+        bot=FakeBot(loop),
+        guild=guild,
+        channel=SimpleNamespace(id=3),
+        author=fake_member(),
+        cog=None,
+    )
@@ -0,0 +1,56 @@
+import gc
+import statistics
+import time
+import tracemalloc
+
+
+def measure(
+    name: str, fn, *, params=None, number: int = 1, repeat: int = 5, setup=None
+):
+    """Time fn() number times per repeat, and return per-call stats in seconds.
+
+    Args:
+        name (str): What's being measured, like "queue.shuffle".
+        fn: What to time. Gets setup's return value if there's a setup.
+        params (dict, optional): The sizes etc. it was measured with.
+        number (int): Calls per timed repeat. Defaults to 1.
+        repeat (int): Timed repeats. Defaults to 5.
+        setup (optional): Called untimed before each repeat.
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(arg) if setup else fn()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        "name": name,
+        "params": params or {},
+        "unit": "seconds",
+        "number": number,
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if repeat > 1 else 0.0,
+    }
+
+
+def measure_memory(name: str, fn, count: int, *, params=None):
+    """Bytes still allocated per item after fn() builds count items (and keeps them alive)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fn()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return {
+        "name": name,
+        "params": params or {"count": count},
+        "unit": "bytes",
+        "value": (after - before) / count,
+    }
@@ -0,0 +1,76 @@
+"""Offline micro-benchmarks for the queue, track and rendering hot paths.
+
+Usage: python -m benchmarks.run [--quick] [--output results.json] [--only queue]
+
+yt-dlp is replaced by benchmarks.fakes.FakeYoutubeDL and Discord by fake contexts, so nothing
+touches the network. Results are written as JSON with the library versions they were measured
+against, to compare across py-cord and yt-dlp upgrades.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import platform
+import sys
+import time
+
+import discord
+import yt_dlp
+
+from benchmarks import fakes
+
+SUITES = ["bench_tracks", "bench_queue", "bench_audio"]
+SIZES = [10_000, 100_000]
+QUICK_SIZES = [1_000, 10_000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--quick", action="store_true", help="smaller sizes, for a smoke test"
+    )
+    parser.add_argument("--output", "-o", help="write JSON here instead of stdout")
+    parser.add_argument(
+        "--only", action="append", help="run only suites containing this"
+    )
+    args = parser.parse_args()
+
+    fakes.install()
+    sizes = QUICK_SIZES if args.quick else SIZES
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    results = []
+    for name in SUITES:
+        if args.only and not any(only in name for only in args.only):
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        suite = importlib.import_module(f"benchmarks.{name}")
+        results += suite.run(loop, sizes)
+
+    for task in asyncio.all_tasks(loop):
+        task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+
+    report = json.dumps(
+        {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "py-cord": discord.__version__,
+            "yt-dlp": yt_dlp.version.__version__,
+            "sizes": sizes,
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
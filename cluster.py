@@ -0,0 +1,130 @@
+"""Run the bot as several processes ("clusters"), each owning a contiguous range of shards.
+
+Usage: python cluster.py
+
+Reads shard_count and cluster_count from configuration.json. If shard_count isn't set, Discord's
+recommended count is used. Each cluster runs main.py with its shards in the environment, its
+output is prefixed and merged into ours, and clusters that exit are restarted with backoff.
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+
+# Discord allows one IDENTIFY per 5 seconds (per max_concurrency bucket)
+IDENTIFY_DELAY = 5
+# Longest wait between restarts of a cluster that keeps dying
+MAX_RESTART_DELAY = 60
+# A cluster that ran this long before exiting resets its backoff
+HEALTHY_RUNTIME = 60
+
+
+def log(message):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} [launcher] {message}", flush=True)
+
+
+async def recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def split_shards(shardCount: int, clusterCount: int) -> list[list[int]]:
+    """Split shards 0..shardCount-1 into clusterCount contiguous ranges of near-equal size."""
+    clusterCount = max(1, min(clusterCount, shardCount))
+    size, extra = divmod(shardCount, clusterCount)
+    ranges, start = [], 0
+    for i in range(clusterCount):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Cluster:
+    def __init__(self, clusterId: int, shards: list[int], shardCount: int):
+        self.id = clusterId
+        self.shards = shards
+        self.shardCount = shardCount
+        self.process: asyncio.subprocess.Process | None = None
+        self.failures = 0
+        self.stopping = False
+
+    async def run(self, startDelay: float):
+        """Run main.py until we're told to stop, restarting it whenever it exits."""
+        await asyncio.sleep(startDelay)
+        while not self.stopping:
+            startedAt = time.monotonic()
+            log(f"Starting cluster {self.id} with shards {self.shards}")
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                "-u",
+                "main.py",
+                env={
+                    **os.environ,
+                    "CADENCE_CLUSTER_ID": str(self.id),
+                    "CADENCE_SHARD_IDS": ",".join(map(str, self.shards)),
+                    "CADENCE_SHARD_COUNT": str(self.shardCount),
+                },
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+            async for line in self.process.stdout:
+                sys.stdout.write(f"[cluster {self.id}] {line.decode(errors='replace')}")
+                sys.stdout.flush()
+            code = await self.process.wait()
+            if self.stopping:
+                break
+
+            if time.monotonic() - startedAt > HEALTHY_RUNTIME:
+                self.failures = 0
+            self.failures += 1
+            delay = min(
+                2 ** (self.failures - 1) + IDENTIFY_DELAY * len(self.shards),
+                MAX_RESTART_DELAY,
+            )
+            log(f"Cluster {self.id} exited with code {code}, restarting in {delay}s")
+            await asyncio.sleep(delay)
+
+    def stop(self):
+        self.stopping = True
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def main():
+    with open("configuration.json", "r") as data:
+        config = json.load(data)
+
+    shardCount = config.get("shard_count") or await recommended_shards(config["token"])
+    clusters = [
+        Cluster(i, shards, shardCount)
+        for i, shards in enumerate(
+            split_shards(shardCount, config.get("cluster_count", os.cpu_count() or 1))
+        )
+    ]
+    log(f"Running {shardCount} shards across {len(clusters)} clusters")
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: [cluster.stop() for cluster in clusters])
+
+    # stagger startup so the clusters don't all try to identify at once
+    delay, runs = 0, []
+    for cluster in clusters:
+        runs.append(cluster.run(delay))
+        delay += IDENTIFY_DELAY * len(cluster.shards)
+    await asyncio.gather(*runs)
+    log("All clusters stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
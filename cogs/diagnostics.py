@@ -0,0 +1,72 @@
+import asyncio
+import io
+import threading
+
+import discord
+from discord.ext import bridge, commands
+
+from utils.checks import is_bot_owner
+from utils.embed import quick_embed
+from utils.watchdog import LoopWatchdog, sample_profile
+
+# Longest profile the profile command will run, in seconds
+MAX_PROFILE_SECONDS = 60
+# Functions listed in each table of profile results
+PROFILE_TOP = 15
+
+
+def profile_table(title: str, counts, samples: int) -> str:
+    lines = [title]
+    for name, count in counts.most_common(PROFILE_TOP):
+        lines.append(f"{count / samples:6.1%}  {name}")
+    return "\n".join(lines)
+
+
+class DiagnosticsCog(commands.Cog):
+    def __init__(self, bot):
+        """Watches for blocking code on the event loop, and profiles it on request."""
+        self.bot = bot
+        self.loopThread: int | None = None
+        self.watchdog = LoopWatchdog(
+            bot.loop, bot.logger, **bot.config.get("watchdog", {})
+        )
+        self.startTask = bot.loop.create_task(self.start())
+
+    async def start(self):
+        # the watchdog has to know which thread the loop runs on
+        self.loopThread = threading.get_ident()
+        self.watchdog.start()
+
+    def cog_unload(self):
+        self.startTask.cancel()
+        self.watchdog.stop()
+
+    @bridge.bridge_command()
+    @is_bot_owner()
+    async def profile(self, ctx, seconds: float = 10):
+        """Sample what the event loop is busy with for a few seconds (owner only)"""
+        seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+        await ctx.defer()
+        samples, own, total = await asyncio.get_running_loop().run_in_executor(
+            None, sample_profile, self.loopThread, seconds
+        )
+        if not samples:
+            raise commands.UserInputError("Couldn't sample the event loop")
+
+        report = "\n\n".join(
+            [
+                f"{samples} samples over {seconds:g}s, {self.watchdog.stalls} stalls since startup",
+                profile_table("Running (self)", own, samples),
+                profile_table("On the stack (total)", total, samples),
+            ]
+        )
+        if len(report) < 4000:
+            await ctx.respond(embed=quick_embed(ctx, f"```\n{report}\n```"))
+        else:
+            await ctx.respond(
+                file=discord.File(io.BytesIO(report.encode()), filename="profile.txt")
+            )
+
+
+def setup(bot):
+    bot.add_cog(DiagnosticsCog(bot))
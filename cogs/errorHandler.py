@@ -3,13 +3,16 @@ import logging
 from datetime import datetime, timedelta
 import traceback
 
-import aiohttp
 import discord
-from discord import Webhook
 from discord.ext import commands
 from discord.ext.commands import Context
 
 from utils.embed import command_embed
+from utils.logs import traceId
+from utils.reporter import error_key
+
+# Characters of a traceback that fit in an error report's embed
+MAX_TRACEBACK = 4000
 
 
 class ErrorHandlerCog(commands.Cog, name="on command error"):
@@ -28,7 +31,6 @@ class ErrorHandlerCog(commands.Cog, name="on command error"):
 
     async def handle_errors(self, ctx: Context, error: commands.CommandError):
         logger = self.bot.logger
-        webhookUrl = self.bot.config["error_webhook_url"]
         supportUrl = self.bot.config["support_invite"]
 
         if isinstance(error, commands.CommandNotFound):
@@ -87,25 +89,28 @@ class ErrorHandlerCog(commands.Cog, name="on command error"):
         except Exception as e:
             options = []
 
-        if webhookUrl:
-            async with aiohttp.ClientSession() as session:
-                webhook = Webhook.from_url(webhookUrl, session=session)
-
-                e = (
-                    discord.Embed(
-                        title="Cadence Command Error",
-                        description=f"```{''.join(traceback.format_exception(type(error), error, error.__traceback__))}```",
-                        color=0xFF0000,
-                    )
-                    .add_field(
-                        name="Command",
-                        value=f"/{ctx.command.name} {' '.join(options)}",
-                    )
-                    .add_field(name="User", value=f"{ctx.author} ({ctx.author.id})")
-                    .add_field(name="Guild", value=f"{ctx.guild} ({ctx.guild.id})")
+        if self.bot.reporter.enabled:
+            # the end of the traceback is the interesting part, and embeds only fit so much
+            trace = "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            )[-MAX_TRACEBACK:]
+            e = (
+                discord.Embed(
+                    title="Cadence Command Error",
+                    description=f"```{trace}```",
+                    color=0xFF0000,
                 )
-
-                await webhook.send(embed=e)
+                .add_field(
+                    name="Command",
+                    value=f"/{ctx.command.name} {' '.join(options)}",
+                )
+                .add_field(name="User", value=f"{ctx.author} ({ctx.author.id})")
+                .add_field(name="Guild", value=f"{ctx.guild} ({ctx.guild.id})")
+                # to find the command's logs
+                .add_field(name="Trace", value=traceId.get() or "None")
+            )
+            # the same error over and over is sent once, then counted
+            self.bot.reporter.report(e, key=error_key(error))
 
         logger.error(
             f"Uncaught exception in command {ctx.command} invoked by {ctx.author}.",
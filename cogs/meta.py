@@ -1,8 +1,7 @@
-import aiohttp
 import discord
 from discord.ext import bridge, commands
 from utils.embed import quick_embed
-from discord import Webhook
+from utils.track import extractionPool
 
 
 class MetaCog(commands.Cog):
@@ -34,6 +33,24 @@ class MetaCog(commands.Cog):
             name="Stats",
             value=f"**Ping:** {round(self.bot.latency * 1000)} ms\n**Guilds:** {len(self.bot.guilds)}\n**Users:** {len(self.bot.users)}",
         )
+        music = self.bot.get_cog("MusicCog")
+        if music:
+            players = music.supervisor.stats()
+            embed.add_field(
+                name="Players",
+                value=f"**Connected:** {players['players']}\n**Playing:** {players['playing']}\n**Restarts:** {players['restarts']}",
+            )
+        pool = extractionPool.stats()
+        embed.add_field(
+            name="Extraction",
+            value=f"**Queued:** {pool['depth']}\n**Busy:** {pool['busy']}/{pool['workers']} workers\n**Wait:** {round(pool['average_wait'] * 1000)} ms avg, {round(pool['last_wait'] * 1000)} ms last",
+        )
+        if self.bot.reporter.enabled:
+            reports = self.bot.reporter.stats()
+            embed.add_field(
+                name="Error reports",
+                value=f"**Sent:** {reports['sent']} messages\n**Grouped:** {reports['grouped']}\n**Dropped:** {reports['dropped']}\n**Queued:** {reports['queued']}",
+            )
         embed.set_footer(
             text=f"Requested by {ctx.author.name}",
             icon_url=ctx.author.display_avatar.url,
@@ -44,27 +61,25 @@ class MetaCog(commands.Cog):
     @commands.cooldown(1, 5, commands.BucketType.user)
     async def report(self, ctx, *, message):
         """Report a bug or request a feature"""
-        if not self.bot.config["error_webhook_url"]:
+        if not self.bot.reporter.enabled:
             raise commands.UserInputError("This command is disabled, sorry")
 
         if len(message) > 2000:
             message = message[:2000]
-        webhookUrl = self.bot.config["error_webhook_url"]
 
-        async with aiohttp.ClientSession() as session:
-            webhook = Webhook.from_url(webhookUrl, session=session)
-
-            e = (
-                discord.Embed(
-                    title="Cadence Bug Report",
-                    description=message,
-                    color=int(ctx.bot.config["color"][1:], 16),
-                )
-                .add_field(name="User", value=f"{ctx.author} ({ctx.author.id})")
-                .add_field(name="Guild", value=f"{ctx.guild} ({ctx.guild.id})")
+        e = (
+            discord.Embed(
+                title="Cadence Bug Report",
+                description=message,
+                color=int(ctx.bot.config["color"][1:], 16),
+            )
+            .add_field(name="User", value=f"{ctx.author} ({ctx.author.id})")
+            .add_field(name="Guild", value=f"{ctx.guild} ({ctx.guild.id})")
+        )
+        if not self.bot.reporter.report(e):
+            raise commands.UserInputError(
+                "Too many reports are waiting to be sent, try again in a bit"
             )
-
-            await webhook.send(embed=e)
         await ctx.respond(
             embed=quick_embed(
                 ctx, "Report sent! Thank you for your feedback, it helps a lot!"
@@ -0,0 +1,78 @@
+from aiohttp import web
+from discord.ext import commands
+
+from utils import metrics
+from utils.track import extractionPool
+
+
+class MetricsCog(commands.Cog):
+    def __init__(self, bot):
+        """Serves Prometheus metrics over HTTP, if metrics.port is set in the configuration.
+        When cluster.py runs several processes, each one serves on metrics.port plus its
+        cluster id.
+
+        Event loop lag is measured by DiagnosticsCog's watchdog.
+        """
+        self.bot = bot
+        self.runner: web.AppRunner | None = None
+        config = bot.config.get("metrics", {})
+
+        metrics.players.collect = lambda: len(self._players())
+        metrics.playing.collect = lambda: sum(
+            1 for player in self._players() if not player.is_idle()
+        )
+        metrics.ffmpegProcesses.collect = lambda: sum(
+            (player.nowPlaying is not None and player.nowPlaying.source is not None)
+            + (player.handoff is not None)
+            for player in self._players()
+        )
+        metrics.queuedTracks.collect = lambda: sum(
+            len(player.queue) for player in self._players()
+        )
+        metrics.longestQueue.collect = lambda: max(
+            (len(player.queue) for player in self._players()), default=0
+        )
+        metrics.extractionWorkers.collect = lambda: extractionPool.stats()["workers"]
+        metrics.extractionBusy.collect = lambda: extractionPool.stats()["busy"]
+        metrics.extractionBacklog.collect = lambda: extractionPool.stats()["depth"]
+        metrics.extractionWait.collect = lambda: extractionPool.stats()["average_wait"]
+
+        self.serverTask = None
+        if config.get("port"):
+            port = config["port"] + int(bot.cluster_id or 0)
+            self.serverTask = bot.loop.create_task(
+                self.serve(config.get("host", "127.0.0.1"), port)
+            )
+
+    def cog_unload(self):
+        if self.runner is not None:
+            self.bot.loop.create_task(self.runner.cleanup())
+
+    def _players(self):
+        music = self.bot.get_cog("MusicCog")
+        return list(music.queues.values()) if music else []
+
+    async def serve(self, host: str, port: int):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, host, port).start()
+        except OSError as e:
+            # like the port being taken
+            self.bot.logger.error(f"Couldn't serve metrics on {host}:{port}: {e}")
+            await self.runner.cleanup()
+            self.runner = None
+            return
+        self.bot.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def handle_metrics(self, request):
+        return web.Response(
+            body=metrics.registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+
+def setup(bot):
+    bot.add_cog(MetricsCog(bot))
@@ -1,15 +1,168 @@
+import asyncio
+import time
+from math import ceil
+
 import discord
-from discord.ext import bridge, commands, pages
+from discord.ext import bridge, commands
 from discord.ext.bridge import BridgeContext
 from utils.queue import GuildQueue
+from utils.supervisor import PlayerSupervisor
+from utils.track import audioCache, extractionPool, metadataCache
 from utils.embed import quick_embed
+from utils.metrics import firstAudioSeconds
+from utils.search import MAX_CHOICES, RemoteSearch, playedIndex
 from utils.checks import (
     has_active_queue,
     has_active_song,
     queue_not_empty,
     author_present,
 )
-from utils.utils import chunks
+from utils.panel import EditScheduler, NowPlayingPanel
+from utils.utils import parse_time
+from utils.view import PageView
+
+
+# Seconds between edits to a playlist's loading message
+PROGRESS_INTERVAL = 3
+# Tracks per page of the queue command
+QUEUE_PAGE_SIZE = 10
+# Seconds after which nowplaying posts a new panel instead of pointing at the old one
+NP_REPOST_AFTER = 120
+# Most queries playmany takes at once
+MAX_BULK = 25
+# Longest a failed query or its error is shown in playmany's reply
+SUMMARY_TEXT_LENGTH = 80
+
+
+def playlist_progress(loader):
+    total = f"/{loader.total}" if loader.total else ""
+    if loader.task.cancelled():
+        return f"Stopped loading {loader.title} after {loader.loaded} tracks"
+    elif loader.error:
+        return f"Added {loader.loaded} tracks from {loader.title} to queue (couldn't load the rest: {loader.error})"
+    elif loader.task.done():
+        return f"Added {loader.loaded} tracks from {loader.title} to queue"
+    return f"Loading {loader.title}... {loader.loaded}{total} tracks added"
+
+
+async def respond_added(ctx, tracks, loader):
+    if loader is None:
+        await ctx.respond(
+            f"Added {len(tracks)} track{'s' if len(tracks) > 1 else ''} to queue",
+            embed=tracks[0].to_embed(),
+        )
+        return
+
+    await ctx.respond(playlist_progress(loader), embed=tracks[0].to_embed())
+    # keep the reply updated while the rest of the playlist loads
+    while not loader.task.done():
+        await asyncio.wait({loader.task}, timeout=PROGRESS_INTERVAL)
+        await ctx.edit(content=playlist_progress(loader))
+
+
+def split_queries(text: str) -> list[str]:
+    """Split playmany's input into queries: one per line or between semicolons, and a line of
+    nothing but links is one query per link."""
+    queries = []
+    for line in text.replace(";", "\n").splitlines():
+        words = [word.strip("<>") for word in line.split()]
+        if not words:
+            continue
+        if all(word.startswith(("http://", "https://")) for word in words):
+            queries.extend(words)
+        else:
+            queries.append(" ".join(words))
+    return queries
+
+
+def shorten(text: str, length: int = SUMMARY_TEXT_LENGTH) -> str:
+    return text if len(text) <= length else text[: length - 1] + "…"
+
+
+def bulk_progress(bulk) -> str:
+    """playmany's reply: how much has been queued, then a line per query that failed."""
+    tracks = f"{bulk.loaded} track{'s' if bulk.loaded != 1 else ''}"
+    if bulk.task.cancelled():
+        lines = [f"Stopped after adding {tracks} to queue"]
+    elif bulk.task.done():
+        lines = [
+            f"Added {tracks} from {len(bulk.successes())} of {len(bulk.queries)} queries to queue"
+        ]
+    else:
+        lines = [
+            f"Loading {len(bulk.results)}/{len(bulk.queries)} queries... {tracks} added"
+        ]
+    for query, result in zip(bulk.queries, bulk.results):
+        if isinstance(result, Exception):
+            error = str(result) or type(result).__name__
+        elif result[1] is not None and result[1].error:
+            error = f"couldn't load the rest of the playlist: {result[1].error}"
+        else:
+            continue
+        lines.append(f"❌ `{shorten(query)}`: {shorten(error)}")
+    summary = "\n".join(lines)
+    if len(summary) > 2000:
+        summary = summary[:1999] + "…"
+    return summary
+
+
+async def respond_bulk(ctx, bulk):
+    await ctx.respond(bulk_progress(bulk))
+    # keep the reply updated while the queries load, like respond_added
+    while not bulk.task.done():
+        await asyncio.wait({bulk.task}, timeout=PROGRESS_INTERVAL)
+        await ctx.edit(content=bulk_progress(bulk))
+    first = next((tracks[0] for tracks, loader in bulk.successes()), None)
+    if first is not None:
+        await ctx.edit(embed=first.to_embed())
+
+
+def check_position(queue, position: int):
+    """Make sure a 1-based position from a user points at a track in the queue."""
+    if position < 1 or position > len(queue.queue):
+        raise commands.UserInputError(
+            f"Pick a position between 1 and {len(queue.queue)}"
+        )
+
+
+def queue_page(queue: GuildQueue, page: int) -> discord.Embed:
+    """Render a page (from 0) of the upcoming tracks."""
+    start = page * QUEUE_PAGE_SIZE
+    tracks = queue.queue.upcoming(start, start + QUEUE_PAGE_SIZE)
+    pageContents = "\n".join(
+        f"{start + i + 1}. [{element.title}]({element.web_url}) {element.pretty_duration()}"
+        for i, element in enumerate(tracks)
+    )
+    return discord.Embed(
+        title=f"Queue page {page + 1}",
+        description=pageContents or "Nothing left on this page",
+        color=0xC84268,
+    )
+
+
+def queue_page_count(queue: GuildQueue) -> int:
+    return max(ceil(len(queue.queue) / QUEUE_PAGE_SIZE), 1)
+
+
+async def play_autocomplete(ctx: discord.AutocompleteContext):
+    """Suggest tracks played here and elsewhere, then YouTube searches if they're enabled."""
+    query = ctx.value or ""
+    if query.startswith(("http://", "https://")):
+        return []
+    choices = [
+        discord.OptionChoice(name=title[:100], value=url)
+        for title, url in playedIndex.search(ctx.interaction.guild_id, query)
+        if len(url) <= 100
+    ]
+    remoteSearch = getattr(ctx.cog, "remoteSearch", None)
+    if remoteSearch and query.strip() and len(choices) < MAX_CHOICES:
+        for suggestion in await remoteSearch.suggest(ctx.interaction.user.id, query):
+            if len(choices) >= MAX_CHOICES:
+                break
+            choices.append(
+                discord.OptionChoice(name=suggestion[:100], value=suggestion[:100])
+            )
+    return choices
 
 
 async def react_or_respond(ctx, message, reaction):
@@ -22,17 +175,40 @@ async def react_or_respond(ctx, message, reaction):
 class MusicCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queues = {}
+        self.supervisor = PlayerSupervisor(bot, **bot.config.get("player", {}))
+        metadataCache.configure(**bot.config.get("metadata_cache", {}))
+        extractionPool.configure(workers=bot.config.get("extraction_workers"))
+        audioCache.configure(**bot.config.get("audio_cache", {}))
+        self.warmed = False
+        autocomplete = bot.config.get("autocomplete", {})
+        self.remoteSearch = (
+            RemoteSearch() if autocomplete.get("remote_search") else None
+        )
+        self.panels = EditScheduler(**bot.config.get("now_playing", {}))
+
+    @property
+    def queues(self) -> dict[int, GuildQueue]:
+        return self.supervisor.players
 
     def get_queue(self, ctx) -> GuildQueue:
         """Get the guild queue object, or make a new one."""
-        try:
-            queue = self.queues[ctx.guild.id]
-        except KeyError:
-            queue = GuildQueue(ctx)
-            self.queues[ctx.guild.id] = queue
+        return self.supervisor.get(ctx)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # import yt-dlp now that we're logged in, rather than during startup or the first play
+        if self.warmed:
+            return
+        self.warmed = True
+        took = await extractionPool.warm()
+        self.bot.logger.info(f"⤷ yt-dlp ready in {took:.2f}s")
 
-        return queue
+    def cog_unload(self):
+        self.bot.loop.create_task(self.supervisor.close())
+        self.bot.loop.create_task(audioCache.close())
+        self.panels.close()
+        if self.remoteSearch:
+            self.bot.loop.create_task(self.remoteSearch.close())
 
     @bridge.bridge_command()
     @bridge.guild_only()
@@ -42,16 +218,45 @@ class MusicCog(commands.Cog):
 
     @bridge.bridge_command(aliases=["p"])
     @bridge.guild_only()
+    @discord.option(
+        "url",
+        description="A link, or something to search for",
+        autocomplete=play_autocomplete,
+    )
     async def play(self, ctx: bridge.BridgeContext, url):
         """Add a song or playlist to queue"""
+        startedAt = time.perf_counter()
         await ctx.defer()
         queue = self.get_queue(ctx)
 
-        tracks = await queue.add_url(ctx, url)
-        await ctx.respond(
-            f"Added {len(tracks)} track{'s' if len(tracks) > 1 else ''} to queue",
-            embed=tracks[0].to_embed(),
-        )
+        tracks, loader = await queue.add_url(ctx, url)
+        if queue.nowPlaying is None:
+            queue.time_first_audio(firstAudioSeconds, startedAt)
+        await respond_added(ctx, tracks, loader)
+
+    @bridge.bridge_command(aliases=["pm", "bulk"])
+    @bridge.guild_only()
+    @discord.option(
+        "queries",
+        description="Links or searches, separated by semicolons (or new lines)",
+    )
+    async def playmany(self, ctx: bridge.BridgeContext, *, queries: str):
+        """Add several songs or playlists to queue at once, in order"""
+        startedAt = time.perf_counter()
+        queryList = split_queries(queries)
+        if not queryList:
+            raise commands.UserInputError(
+                "Give me some links or searches, one per line"
+            )
+        if len(queryList) > MAX_BULK:
+            raise commands.UserInputError(f"That's more than {MAX_BULK} at once")
+        await ctx.defer()
+        queue = self.get_queue(ctx)
+
+        if queue.nowPlaying is None:
+            queue.time_first_audio(firstAudioSeconds, startedAt)
+        bulk = queue.add_urls(ctx, queryList)
+        await respond_bulk(ctx, bulk)
 
     @bridge.bridge_command()
     @has_active_queue()
@@ -88,9 +293,50 @@ class MusicCog(commands.Cog):
     @has_active_song()
     @bridge.guild_only()
     async def nowplaying(self, ctx):
-        """Show the currently playing song."""
+        """Show the currently playing song, and keep showing it as it plays."""
         queue = self.get_queue(ctx)
-        await ctx.respond(embed=queue.np_embed())
+        panel = queue.panel
+        if (
+            panel is not None
+            and panel.message is not None
+            and panel.message.channel.id == ctx.channel.id
+            and time.monotonic() - panel.postedAt < NP_REPOST_AFTER
+        ):
+            # it's still near the bottom of the chat, and it's already up to date
+            if ctx.is_app:
+                await ctx.respond(
+                    f"It's right here: {panel.message.jump_url}", ephemeral=True
+                )
+            else:
+                await ctx.message.add_reaction("⬆️")
+            return
+        if panel is not None:
+            # replace it, rather than having two
+            await panel.close(delete=True)
+        queue.panel = NowPlayingPanel(queue, self.panels)
+        await queue.panel.respond(ctx)
+
+    @bridge.bridge_command()
+    @has_active_queue()
+    @has_active_song()
+    @author_present()
+    @bridge.guild_only()
+    async def seek(self, ctx, timestamp: str):
+        """Jump to a time in the song, like 1:30 (or +10/-10 to skip ahead/back)."""
+        queue = self.get_queue(ctx)
+        try:
+            if timestamp.startswith(("+", "-")):
+                sign = 1 if timestamp[0] == "+" else -1
+                position = queue.progress() + sign * parse_time(timestamp[1:])
+            else:
+                position = parse_time(timestamp)
+            position = max(position, 0)
+            queue.seek(position)
+        except ValueError as e:
+            raise commands.UserInputError(f"Can't seek to {timestamp}: {e}")
+        await react_or_respond(
+            ctx, f"Seeked to {queue.nowPlaying.pretty_duration(position)} ⏩", "⏩"
+        )
 
     @bridge.bridge_command(aliases=["s"])
     @has_active_queue()
@@ -100,10 +346,72 @@ class MusicCog(commands.Cog):
     @bridge.guild_only()
     async def skip(self, ctx):
         """Skip the song."""
-        client = ctx.voice_client
-        client.stop()
+        self.get_queue(ctx).skip()
         await react_or_respond(ctx, "Skipped ⏭️", "⏭️")
 
+    @bridge.bridge_command(aliases=["st"])
+    @has_active_queue()
+    @has_active_song()
+    @queue_not_empty()
+    @author_present()
+    @bridge.guild_only()
+    async def skipto(self, ctx, position: int):
+        """Skip to a song in the queue."""
+        queue = self.get_queue(ctx)
+        check_position(queue, position)
+        queue.skip_to(position - 1)
+        await react_or_respond(ctx, f"Skipped to #{position} ⏭️", "⏭️")
+
+    @bridge.bridge_command(aliases=["rm"])
+    @has_active_queue()
+    @queue_not_empty()
+    @author_present()
+    @bridge.guild_only()
+    async def remove(self, ctx, position: int, end: int = None):
+        """Remove a song, or every song from position to end, from the queue."""
+        queue = self.get_queue(ctx)
+        check_position(queue, position)
+        if end is None:
+            track = queue.queue.remove(position - 1)
+            await ctx.respond(f"Removed {track.title} from queue", silent=True)
+            return
+
+        check_position(queue, end)
+        if end < position:
+            raise commands.UserInputError("The end of the range is before the start")
+        queue.queue.remove_range(position - 1, end)
+        await ctx.respond(
+            f"Removed {end - position + 1} tracks from queue", silent=True
+        )
+
+    @bridge.bridge_command(aliases=["mv"])
+    @has_active_queue()
+    @queue_not_empty()
+    @author_present()
+    @bridge.guild_only()
+    async def move(self, ctx, position: int, destination: int):
+        """Move a song to a different spot in the queue."""
+        queue = self.get_queue(ctx)
+        check_position(queue, position)
+        check_position(queue, destination)
+        track = queue.queue.move(position - 1, destination - 1)
+        await ctx.respond(f"Moved {track.title} to #{destination}", silent=True)
+
+    @bridge.bridge_command(aliases=["pn"])
+    @bridge.guild_only()
+    @discord.option(
+        "url",
+        description="A link, or something to search for",
+        autocomplete=play_autocomplete,
+    )
+    async def playnext(self, ctx: bridge.BridgeContext, url):
+        """Add a song or playlist to the front of the queue"""
+        await ctx.defer()
+        queue = self.get_queue(ctx)
+
+        tracks, loader = await queue.add_url(ctx, url, position=0)
+        await respond_added(ctx, tracks, loader)
+
     @bridge.bridge_command(aliases=["dc", "l", "stop", "end"])
     @has_active_queue()
     @author_present()
@@ -111,12 +419,7 @@ class MusicCog(commands.Cog):
     async def leave(self, ctx):
         """Stop the currently playing song and destroy the player."""
 
-        await self.get_queue(ctx).cleanup()
-        try:
-            del self.queues[ctx.guild.id]
-        except KeyError:
-            pass
-
+        await self.supervisor.stop(ctx.guild.id)
         await react_or_respond(ctx, "Left the voice channel 👋", "👋")
 
     @bridge.bridge_command(aliases=["q"])
@@ -126,40 +429,25 @@ class MusicCog(commands.Cog):
     async def queue(self, ctx):
         """View the queue."""
         queue = self.get_queue(ctx)
-
-        queueList = list(queue.queue._queue)
-        pageList = []
-        for i, chunk in enumerate(chunks(queueList, 10)):
-            pageContents = "\n".join(
-                f"[{element.title}]({element.web_url}) {element.pretty_duration()}"
-                for element in chunk
-            )
-            pageList.append(
-                discord.Embed(
-                    title=f"Queue page {i+1}",
-                    description=pageContents,
-                    color=0xC84268,
-                )
-            )
-        paginator = pages.Paginator(pages=pageList)
-        await paginator.respond(ctx, silent=True)
+        await PageView(
+            ctx,
+            render=lambda page: queue_page(queue, page),
+            page_count=lambda: queue_page_count(queue),
+        ).respond(silent=True)
 
     @bridge.bridge_command(aliases=["vol", "v"])
     @has_active_queue()
     @author_present()
     @bridge.guild_only()
     async def volume(self, ctx, volume: float):
-        """Pick a volume between 0% and 100%."""
+        """Pick a volume between 0% and 100%. At 100%, songs are sent without re-encoding."""
         queue = self.get_queue(ctx)
         if volume < 0 or volume > 100:
             raise commands.UserInputError("Volume must be between 0 and 100%")
         if volume < 1:
             volume = volume * 100
         queue.set_volume(volume / 100)
-        # TODO: take effect immediately if possible
-        await ctx.respond(
-            f"Set volume to {round(volume)}% (takes effect on next song)", silent=True
-        )
+        await ctx.respond(f"Set volume to {round(volume)}%", silent=True)
 
     @bridge.bridge_command(aliases=["sh"])
     @has_active_queue()
@@ -216,6 +504,8 @@ class MusicCog(commands.Cog):
         await react_or_respond(ctx, "Looping off ➡️", "➡️")
 
     @play.before_invoke
+    @playmany.before_invoke
+    @playnext.before_invoke
     @join.before_invoke
     async def join_voice(self, ctx: BridgeContext):
         if not ctx.author.voice:
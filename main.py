@@ -1,12 +1,34 @@
+import time
+
+STARTED_AT = time.perf_counter()
+
+import hashlib
 import json
-import logging
 import os
 
 import discord
 from discord.ext import bridge, commands
 from utils.help import FancyHelp
+from utils.logs import logger, setup_logging, traced
+from utils.reporter import WebhookReporter
 
 VERSION = "1.0.0"
+# Where the last synced command tree's hash and command ids are kept
+COMMAND_CACHE = "command_cache.json"
+
+# Seconds each stage of startup took, logged once we're ready
+startupTimes: dict[str, float] = {}
+lastMark = STARTED_AT
+
+
+def mark(stage: str):
+    global lastMark
+    now = time.perf_counter()
+    startupTimes[stage] = now - lastMark
+    lastMark = now
+
+
+mark("imports")
 
 # Import configuration
 with open("configuration.json", "r") as data:
@@ -16,67 +38,120 @@ with open("configuration.json", "r") as data:
     owner_id = config["bot_owner_id"]
     activity = config["activity"]
     debug_guild = config["debug_guild_id"] if "debug_guild_id" in config else None
+    shard_count = config.get("shard_count") or None  # None asks Discord
 
+# Sharding, set by cluster.py when this is one of several processes
+cluster_id = os.environ.get("CADENCE_CLUSTER_ID")
+shard_ids = None
+if "CADENCE_SHARD_IDS" in os.environ:
+    shard_ids = [int(i) for i in os.environ["CADENCE_SHARD_IDS"].split(",")]
+    shard_count = int(os.environ["CADENCE_SHARD_COUNT"])
 
-# Set up logging
-class LoggingFormatter(logging.Formatter):
-    black = "\x1b[30m"
-    red = "\x1b[31m"
-    green = "\x1b[32m"
-    yellow = "\x1b[33m"
-    blue = "\x1b[34m"
-    gray = "\x1b[38m"
-    reset = "\x1b[0m"
-    bold = "\x1b[1m"
-
-    COLORS = {
-        logging.DEBUG: gray + bold,
-        logging.INFO: blue + bold,
-        logging.WARNING: yellow + bold,
-        logging.ERROR: red,
-        logging.CRITICAL: red + bold,
-    }
-
-    def format(self, record):
-        log_color = self.COLORS[record.levelno]
-        format = "(black){asctime}(reset) (levelcolor){levelname:<8}(reset) {message}"
-        format = format.replace("(black)", self.black + self.bold)
-        format = format.replace("(reset)", self.reset)
-        format = format.replace("(levelcolor)", log_color)
-        formatter = logging.Formatter(format, "%Y-%m-%d %H:%M:%S", style="{")
-        return formatter.format(record)
-
-
-logger = logging.getLogger("discord")
-logger.setLevel(logging.INFO)
-
-# File handler
-fileHandler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
-fileHandler.setFormatter(
-    logging.Formatter(
-        "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
-    )
-)
 
-# Console handler
-consoleHandler = logging.StreamHandler()
-consoleHandler.setFormatter(LoggingFormatter())
-
-# Add handlers
-logger.addHandler(fileHandler)
-logger.addHandler(consoleHandler)
+# Set up logging, written from a background thread
+logListener = setup_logging(config.get("logging", {}), cluster_id)
 
+mark("config")
 
 # Create bot
 intents = discord.Intents.default()
 intents.message_content = True
 
 
-class Bot(bridge.Bot):
+class Bot(bridge.AutoShardedBot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = logger
         self.config = config
+        # error reports and bug reports, batched onto the webhook
+        self.reporter = WebhookReporter(
+            config.get("error_webhook_url"), **config.get("reporter", {})
+        )
+
+    async def close(self):
+        await self.reporter.close()
+        await super().close()
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            await super().invoke(ctx)
+        else:
+            await self.traced_invoke(ctx, super().invoke)
+
+    async def invoke_application_command(self, ctx):
+        await self.traced_invoke(ctx, super().invoke_application_command)
+
+    async def traced_invoke(self, ctx, invoke):
+        """Run a command under a new trace ID, so everything logged for it (extraction, FFmpeg
+        starting, errors) can be told apart from other commands'."""
+        with traced():
+            startedAt = time.perf_counter()
+            name = ctx.command.qualified_name
+            where = f"guild {ctx.guild.id}" if ctx.guild else "DMs"
+            logger.info(f"{ctx.author} ({ctx.author.id}) ran {name} in {where}")
+            await invoke(ctx)
+            logger.info(f"⤷ {name} finished in {time.perf_counter() - startedAt:.2f}s")
+
+    async def on_connect(self):
+        """Sync application commands, unless they haven't changed since the last sync."""
+        firstConnect = "login" not in startupTimes
+        if firstConnect:
+            mark("login")
+        if not self.auto_sync_commands:
+            return
+        if self.load_command_ids():
+            stage = "command sync (skipped, unchanged)"
+        else:
+            await self.sync_commands()
+            self.save_command_ids()
+            stage = "command sync"
+        if firstConnect:
+            mark(stage)
+
+    def command_hash(self) -> str:
+        tree = sorted(
+            (json.dumps(cmd.to_dict(), sort_keys=True), str(cmd.guild_ids))
+            for cmd in self.pending_application_commands
+        )
+        tree.append(str(self.user.id))
+        return hashlib.sha256(json.dumps(tree).encode()).hexdigest()
+
+    def load_command_ids(self) -> bool:
+        """Map commands to their ids from the last sync, if the command tree is the same."""
+        try:
+            with open(COMMAND_CACHE, "r") as data:
+                cache = json.load(data)
+        except (OSError, ValueError):
+            return False
+        if cache.get("hash") != self.command_hash():
+            return False
+        # interactions with ids we don't know trigger a sync anyway, so stale ids heal themselves
+        for commandId, name, commandType, guildIds in cache["commands"]:
+            cmd = discord.utils.find(
+                lambda cmd: cmd.name == name
+                and int(cmd.type) == commandType
+                and cmd.guild_ids == guildIds,
+                self.pending_application_commands,
+            )
+            if cmd is None:
+                return False
+            cmd.id = commandId
+            self._application_commands[commandId] = cmd
+        return True
+
+    def save_command_ids(self):
+        cache = {
+            "hash": self.command_hash(),
+            "commands": [
+                [commandId, cmd.name, int(cmd.type), cmd.guild_ids]
+                for commandId, cmd in self._application_commands.items()
+            ],
+        }
+        # several clusters might write this at once
+        temporary = f"{COMMAND_CACHE}.{os.getpid()}"
+        with open(temporary, "w") as data:
+            json.dump(cache, data)
+        os.replace(temporary, COMMAND_CACHE)
 
 
 bot = Bot(
@@ -86,10 +161,13 @@ bot = Bot(
     # help_command=commands.DefaultHelpCommand(verify_checks=False),
     help_command=FancyHelp(verify_checks=False),
     case_insenitive=True,
+    shard_count=shard_count,
+    shard_ids=shard_ids,
 )
 if debug_guild:
     bot.debug_guilds = [debug_guild]
 bot.version = VERSION
+bot.cluster_id = cluster_id
 
 # Load cogs
 COGS_DIRECTORY = "cogs"
@@ -112,17 +190,30 @@ if __name__ == "__main__":
         foundCogs.remove("dev")
     logger.info(f"Loading cogs: {foundCogs}")
     for extension in foundCogs:
+        loadStart = time.perf_counter()
         try:
             bot.load_extension(COGS_DIRECTORY + "." + extension)
-            logger.info(f"⤷ '{extension}' loaded")
+            logger.info(
+                f"⤷ '{extension}' loaded in {time.perf_counter() - loadStart:.2f}s"
+            )
         except Exception as e:
             logger.error(f"⤷ '{extension}' failed to load. {e}")
+    mark("cogs")
     logger.info("All modules loaded, logging in to Discord")
 
 
 @bot.event
 async def on_ready():
     logger.info(f"Logged in as {bot.user} ({bot.user.id if bot.user else None})")
+    if "ready" not in startupTimes:
+        mark("ready")
+        breakdown = ", ".join(
+            f"{stage} {took:.2f}s" for stage, took in startupTimes.items()
+        )
+        logger.info(
+            f"⤷ Started in {time.perf_counter() - STARTED_AT:.2f}s: {breakdown}"
+        )
+    logger.info(f"⤷ Running shards {sorted(bot.shards)} of {bot.shard_count}")
     if bot.debug_guilds:
         logger.warning(f"⤷ Using debug guild with ID {bot.debug_guilds}")
 
@@ -131,4 +222,7 @@ async def on_ready():
     )
 
 
-bot.run(token)
+try:
+    bot.run(token)
+finally:
+    logListener.stop()
@@ -0,0 +1,209 @@
+import audioop
+import threading
+
+import discord
+
+# How many 20ms frames a volume change is spread over
+RAMP_FRAMES = 10
+# Seconds of audio in each frame read from a source
+FRAME_LENGTH = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+
+class RampingVolume(discord.PCMVolumeTransformer):
+    def __init__(self, original: discord.AudioSource, volume: float = 1.0):
+        """A PCMVolumeTransformer that eases into volume changes over RAMP_FRAMES frames.
+
+        Jumping straight to a new gain mid-stream clicks, so the gain applied to each frame
+        steps linearly from the old volume to the new one instead.
+        """
+        self._gain = max(volume, 0.0)
+        super().__init__(original, volume)
+
+    @property
+    def volume(self) -> float:
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float) -> None:
+        self._volume = max(value, 0.0)
+        self._step = (self._volume - self._gain) / RAMP_FRAMES
+
+    def read(self) -> bytes:
+        ret = self.original.read()
+        if self._gain != self._volume:
+            self._gain += self._step
+            if (self._step > 0) == (self._gain >= self._volume):
+                self._gain = self._volume
+        return audioop.mul(ret, 2, min(self._gain, 2.0))
+
+
+class FrameCounter(discord.AudioSource):
+    def __init__(self, original: discord.AudioSource, start: float = 0, on_start=None):
+        """Wraps a source and counts the 20ms frames read from it, to know exactly how far into
+        the track playback is. Pausing just stops the reads, so it's accounted for too.
+
+        Args:
+            original (discord.AudioSource): The source to wrap.
+            start (float): Where in the track original starts, in seconds. Defaults to 0.
+            on_start (callable, optional): Called from the player thread once the first frame
+                has been read.
+        """
+        self.original = original
+        self.start = start
+        self.frames = 0
+        self.onStart = on_start
+        self._primed: bytes | None = None
+
+    @property
+    def position(self) -> float:
+        """Seconds into the track."""
+        return self.start + self.frames * FRAME_LENGTH
+
+    def prime(self) -> bool:
+        """Blocking. Read the first frame ahead of time, so FFmpeg has already connected and
+        started decoding by the time the frame is needed. Returns whether there was one.
+        """
+        if self._primed is None and not self.frames:
+            self._primed = self.original.read()
+        return bool(self._primed)
+
+    def read(self) -> bytes:
+        if self._primed is not None:
+            data, self._primed = self._primed, None
+        else:
+            data = self.original.read()
+        if data:
+            self.frames += 1
+            if self.frames == 1 and self.onStart is not None:
+                self.onStart()
+        return data
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+
+class TrackMixer(discord.AudioSource):
+    def __init__(self, current: FrameCounter, on_switch=None, on_finished=None):
+        """Plays one track's source after another without a gap.
+
+        The next track's source is queued while the current one is still playing, and the mixer
+        switches to it in the same 20ms read the current one runs out in, so the voice client
+        never sees the end of a track. With a crossfade, the next source starts fading in while
+        the current one fades out instead. PCM sources can be crossfaded; Opus sources are only
+        switched between, since their packets can't be mixed.
+
+        Args:
+            current (FrameCounter): The source to play first.
+            on_switch (callable, optional): Called from the player thread with the outgoing
+                source when the mixer switches to the queued one.
+            on_finished (callable, optional): Called from the player thread with a source the
+                mixer is done with (played out, faded out or dropped), to clean it up.
+        """
+        self.current = current
+        self.upcoming: FrameCounter | None = None
+        self.outgoing: FrameCounter | None = None  # fading out
+        self.onSwitch = on_switch
+        self.onFinished = on_finished
+        self.done = False  # set once the voice client has stopped playing the mixer
+        self._opus = current.is_opus()
+        self._check = None
+        self._fadeAt: float | None = None
+        self._fadeFrames = 0
+        self._faded = 0
+        self._lock = threading.Lock()
+
+    def is_opus(self) -> bool:
+        return self._opus
+
+    def queue(
+        self, source: FrameCounter, crossfade: float = 0, fade_at=None, check=None
+    ):
+        """Play source once the current one ends.
+
+        Args:
+            source (FrameCounter): The next source. It has to match is_opus().
+            crossfade (float): Seconds to crossfade over, for PCM. Defaults to 0.
+            fade_at (float, optional): Position in the current track to start the crossfade at.
+                Without one, the sources are switched when the current one ends.
+            check (callable, optional): Called from the player thread right before switching;
+                if it returns False, source is dropped instead.
+        """
+        with self._lock:
+            if self.upcoming is not None:
+                self._finished(self.upcoming)
+            self.upcoming = source
+            self._check = check
+            if crossfade > 0 and fade_at is not None and not self._opus:
+                self._fadeAt = fade_at
+                self._fadeFrames = max(round(crossfade / FRAME_LENGTH), 1)
+            else:
+                self._fadeAt = None
+
+    def drop_upcoming(self) -> bool:
+        """Don't switch to the queued source after all. Returns whether there was one."""
+        with self._lock:
+            source, self.upcoming = self.upcoming, None
+        if source is not None:
+            self._finished(source)
+        return source is not None
+
+    def read(self) -> bytes:
+        with self._lock:
+            if (
+                self.upcoming is not None
+                and self._fadeAt is not None
+                and self.current.position >= self._fadeAt
+            ):
+                self._switch(fade=True)
+            data = self.current.read()
+            if self.outgoing is not None:
+                data = self._mix(data)
+            elif not data and self.upcoming is not None:
+                self._switch(fade=False)
+                data = self.current.read()
+            return data
+
+    def _switch(self, fade: bool):
+        source, self.upcoming = self.upcoming, None
+        if self._check is not None and not self._check():
+            self._finished(source)
+            return
+        old, self.current = self.current, source
+        if fade:
+            self.outgoing, self._faded = old, 0
+        if self.onSwitch is not None:
+            self.onSwitch(old)
+        if not fade:
+            self._finished(old)
+
+    def _mix(self, data: bytes) -> bytes:
+        fading = self.outgoing.read()
+        self._faded += 1
+        gain = self._faded / self._fadeFrames
+        if not fading or gain >= 1:
+            self._finished(self.outgoing)
+            self.outgoing = None
+            return data or fading
+        if not data:
+            # the next track is shorter than the crossfade
+            return audioop.mul(fading, 2, 1 - gain)
+        return audioop.add(
+            audioop.mul(data, 2, gain), audioop.mul(fading, 2, 1 - gain), 2
+        )
+
+    def _finished(self, source: FrameCounter):
+        if self.onFinished is not None:
+            self.onFinished(source)
+        else:
+            source.cleanup()
+
+    def cleanup(self) -> None:
+        with self._lock:
+            sources = [self.current, self.upcoming, self.outgoing]
+            self.upcoming = self.outgoing = None
+        for source in sources:
+            if source is not None:
+                source.cleanup()
@@ -0,0 +1,205 @@
+import asyncio
+import contextlib
+import logging
+import os
+import re
+from collections import OrderedDict
+
+import aiohttp
+
+# Download streams in ranges this big; YouTube throttles requests for whole files
+CHUNK_SIZE = 10 * 1024 * 1024
+# How many files can download at once, across every guild
+MAX_DOWNLOADS = 4
+
+logger = logging.getLogger("discord")
+
+
+class AudioCache:
+    def __init__(self, path=None, max_bytes: int = 2 * 1024**3, prefetch: int = 2):
+        """An optional on-disk cache of track audio, evicted least-recently-used past a size budget.
+
+        Upcoming tracks are downloaded in the background, and playback reads the local file when
+        there is one, so network hiccups don't stall playback and looped tracks are only fetched
+        once.
+
+        Args:
+            path (str, optional): Directory to keep files in. Defaults to disabled.
+            max_bytes (int): How much audio to keep. Defaults to 2 GiB.
+            prefetch (int): How many upcoming tracks to download ahead. Defaults to 2.
+        """
+        self.path = None
+        self.maxBytes = max_bytes
+        self.prefetchCount = prefetch
+        self.size = 0
+        self._files: OrderedDict[
+            str, int
+        ] = OrderedDict()  # name: bytes, oldest use first
+        self._downloads: dict[str, asyncio.Task] = {}
+        self._session: aiohttp.ClientSession | None = None
+        self._slots: asyncio.Semaphore | None = None
+        if path:
+            self.open(path)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def configure(self, path=None, max_bytes=None, prefetch=None):
+        """Apply settings from the bot's configuration."""
+        if max_bytes is not None:
+            self.maxBytes = max_bytes
+        if prefetch is not None:
+            self.prefetchCount = prefetch
+        if path:
+            self.open(path)
+
+    def open(self, path: str):
+        """Use the directory at path, picking up files left there by a previous run."""
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        files = []
+        for entry in os.scandir(path):
+            if entry.name.endswith(".part"):
+                remove_quietly(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self._files = OrderedDict((name, size) for _, name, size in sorted(files))
+        self.size = sum(self._files.values())
+        for evicted in self._evict():
+            remove_quietly(evicted)
+
+    def get(self, name: str) -> str | None:
+        """Path to the cached file for name, or None. Counts as a use for eviction."""
+        if not self.enabled or name not in self._files:
+            return None
+        filePath = os.path.join(self.path, name)
+        # someone may have cleaned the directory out, and FFmpeg can't fall back once it's started
+        if not os.path.isfile(filePath):
+            self._forget(name)
+            return None
+        self._files.move_to_end(name)
+        # the order in memory is what counts; the mtime only carries it over to the next run
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            touch(filePath)
+        else:
+            loop.run_in_executor(None, touch, filePath)
+        return filePath
+
+    def prefetch(self, name: str, url: str, headers: dict | None = None):
+        """Start downloading url into the cache as name, unless it's cached or downloading."""
+        if not self.enabled or name in self._files or name in self._downloads:
+            return
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+            self._slots = asyncio.Semaphore(MAX_DOWNLOADS)
+        task = asyncio.get_running_loop().create_task(
+            self._download(name, url, headers or {})
+        )
+        self._downloads[name] = task
+        task.add_done_callback(lambda _: self._downloads.pop(name, None))
+
+    async def close(self):
+        for task in list(self._downloads.values()):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _download(self, name: str, url: str, headers: dict):
+        filePath = os.path.join(self.path, name)
+        partPath = filePath + ".part"
+        size = 0
+        # the disk can be slow, so files are only touched from the executor
+        run = asyncio.get_running_loop().run_in_executor
+        try:
+            async with self._slots:
+                file = await run(None, open, partPath, "wb")
+                try:
+                    while True:
+                        rangeHeaders = {
+                            **headers,
+                            "Range": f"bytes={size}-{size + CHUNK_SIZE - 1}",
+                        }
+                        async with self._session.get(
+                            url, headers=rangeHeaders
+                        ) as response:
+                            response.raise_for_status()
+                            async for data in response.content.iter_chunked(65536):
+                                await run(None, file.write, data)
+                                size += len(data)
+                            total = content_length(response) or size
+                        if size >= total or size > self.maxBytes:
+                            break
+                finally:
+                    await asyncio.shield(run(None, file.close))
+            if size > self.maxBytes:
+                raise ValueError("too big to cache")
+            await run(None, os.replace, partPath, filePath)
+        except asyncio.CancelledError:
+            # there's no file yet if it was waiting for a slot; nothing waits on the removal
+            run(None, remove_quietly, partPath)
+            raise
+        except Exception as e:
+            logger.warning(f"Couldn't cache {name}: {e}")
+            await run(None, remove_quietly, partPath)
+            return
+
+        self._files[name] = size
+        self.size += size
+        evicted = self._evict()
+        if evicted:
+            await run(None, remove_all, evicted)
+
+    def _evict(self) -> list[str]:
+        """Forget the least recently used files until the cache fits, returning their paths to remove.
+
+        They're forgotten before they're removed, so get() never hands one out in between.
+        FFmpeg keeps reading a file that's in use after it's unlinked.
+        """
+        evicted = []
+        while self.size > self.maxBytes and self._files:
+            name, _ = next(iter(self._files.items()))
+            evicted.append(os.path.join(self.path, name))
+            self._forget(name)
+        return evicted
+
+    def _forget(self, name: str):
+        self.size -= self._files.pop(name, 0)
+
+
+def remove_quietly(path: str):
+    """Blocking. Remove the file at path, if it's still there."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+def remove_all(paths: list[str]):
+    """Blocking. Remove every file in paths that's still there."""
+    for path in paths:
+        remove_quietly(path)
+
+
+def touch(path: str):
+    """Blocking. Mark the file at path as just used, if it's still there."""
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)
+
+
+def content_length(response: aiohttp.ClientResponse) -> int | None:
+    """The full size of a ranged response's resource, from Content-Range (bytes 0-99/1234)."""
+    if response.status != 206:
+        return None
+    _, _, total = response.headers.get("Content-Range", "").rpartition("/")
+    return int(total) if total.isdigit() else None
+
+
+def cache_name(data: dict) -> str | None:
+    """A file name for a processed info dict's audio, or None if it shouldn't be cached."""
+    if data.get("is_live") or not data.get("id"):
+        return None
+    name = f"{data.get('extractor_key', 'generic')}-{data['id']}.{data.get('ext', 'audio')}"
+    return re.sub(r"[^\w.-]", "_", name)
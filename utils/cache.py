@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from utils.logs import logger
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {"si", "feature", "pp", "ab_channel", "fbclid", "gclid"}
+
+
+def cache_key(query: str) -> str:
+    """Normalize a URL or search query so equivalent requests share a cache entry."""
+    query = query.strip()
+    parts = urlsplit(query)
+    if not parts.scheme or not parts.netloc:
+        return "search:" + " ".join(query.casefold().split())
+
+    host = parts.netloc.lower()
+    if host.startswith("www.") or host.startswith("m."):
+        host = host.split(".", 1)[1]
+    if host == "youtu.be":
+        # short links are just a video id in the path
+        host, path = "youtube.com", "/watch"
+        params = [("v", parts.path.strip("/"))] + parse_qsl(parts.query)
+    else:
+        path = parts.path.rstrip("/") or "/"
+        params = parse_qsl(parts.query)
+
+    params = sorted(
+        (k, v)
+        for k, v in params
+        if k not in TRACKING_PARAMS and not k.startswith("utm_")
+    )
+    return urlunsplit(("https", host, path, urlencode(params), ""))
+
+
+class MetadataCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, path=None):
+        """An LRU cache of flat yt-dlp results, shared by every guild.
+
+        Entries are stored as JSON so hits can't be mutated by whoever extracted them. If a path
+        is given, entries are also written to a sqlite database so they survive restarts.
+
+        Args:
+            max_entries (int): How many entries to keep in memory. Defaults to 1024.
+            ttl (float): Seconds an entry stays valid. Defaults to an hour.
+            path (str, optional): Where to keep the sqlite database. Defaults to memory only.
+        """
+        self.maxEntries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = (
+            threading.Lock()
+        )  # for _entries only, so memory lookups never wait on disk
+        self._dbLock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if path:
+            self.open(path)
+
+    def configure(self, max_entries=None, ttl=None, path=None):
+        """Apply settings from the bot's configuration."""
+        if max_entries is not None:
+            self.maxEntries = max_entries
+        if ttl is not None:
+            self.ttl = ttl
+        if path:
+            self.open(path)
+
+    def open(self, path: str):
+        """Start persisting entries to the sqlite database at path."""
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, expires REAL, data TEXT)"
+        )
+        db.execute("DELETE FROM metadata WHERE expires < ?", (time.time(),))
+        db.commit()
+        with self._dbLock:
+            if self._db:
+                self._db.close()
+            self._db = db
+
+    def get(self, key: str, disk: bool = True):
+        """Return a fresh copy of the cached info dict for key, or None if it's missing or stale.
+
+        Pass disk=False to only check memory, which never waits on the database (or anyone
+        using it), so it's safe to call from the event loop.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None and disk:
+            entry = self._load(key, now)
+        return json.loads(entry[1]) if entry is not None else None
+
+    def _load(self, key: str, now: float):
+        """Blocking. Read an entry from the database into memory, if it's there and fresh."""
+        with self._dbLock:
+            if self._db is None:
+                return None
+            try:
+                entry = self._db.execute(
+                    "SELECT expires, data FROM metadata WHERE key = ?", (key,)
+                ).fetchone()
+                if entry is not None and entry[0] <= now:
+                    self._db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+                    self._db.commit()
+                    return None
+            except sqlite3.OperationalError as e:
+                # probably another process holding the database; it's only a cache
+                self._db.rollback()
+                logger.warning(f"Couldn't read {key} from the metadata cache: {e}")
+                return None
+        if entry is not None:
+            with self._lock:
+                self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, data: dict):
+        """Cache an info dict. Playlist entries must already be a list, not a generator."""
+        # not imported at the top, so startup doesn't wait on importing yt-dlp
+        from yt_dlp import YoutubeDL
+
+        entry = (time.time() + self.ttl, json.dumps(YoutubeDL.sanitize_info(data)))
+        with self._lock:
+            self._remember(key, entry)
+        with self._dbLock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)", (key, *entry)
+                )
+                self._db.commit()
+            except sqlite3.OperationalError as e:
+                # like "database is locked", with several clusters sharing the file
+                self._db.rollback()
+                logger.warning(f"Couldn't save {key} to the metadata cache: {e}")
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
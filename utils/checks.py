@@ -58,3 +58,14 @@ def author_present():
         return True
 
     return commands.check(predicate)
+
+
+def is_bot_owner():
+    """Make sure only the bot's owner can run the command"""
+
+    async def predicate(ctx) -> bool:
+        if not await ctx.bot.is_owner(ctx.author):
+            raise commands.UserInputError("Only my owner can use this command")
+        return True
+
+    return commands.check(predicate)
@@ -0,0 +1,207 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class ExtractionPool:
+    def __init__(self, options: dict, workers: int = 4, factory=None):
+        """A dedicated pool of threads for yt-dlp calls, each with its own YoutubeDL instance.
+
+        Jobs are queued per group (usually a guild) and workers take them round-robin across
+        groups, so one guild importing a huge playlist can't starve everyone else. A job can also
+        be pinned to one worker, for work that has to keep using the same YoutubeDL (like paging
+        through a playlist generator that worker created).
+
+        Args:
+            options (dict): Options for each worker's YoutubeDL.
+            factory (optional): Called with options to make each worker's YoutubeDL. Defaults to
+                make_ytdl.
+            workers (int): How many threads to run. Defaults to 4.
+        """
+        self.options = options
+        self.workers = workers
+        self.factory = factory or make_ytdl
+        self._groups: OrderedDict[object, deque] = OrderedDict()
+        self._ready = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._pinned: list[deque] = []
+        self._local = threading.local()
+        self._inflight: dict[object, list[asyncio.Future]] = {}  # shared jobs' waiters
+
+        self.depth = 0
+        self.busy = 0
+        self.completed = 0
+        self.coalesced = (
+            0  # calls that joined a shared job instead of running their own
+        )
+        self.lastWait = 0.0
+        self.averageWait = 0.0  # exponentially weighted, in seconds
+
+    def configure(self, workers=None):
+        """Apply settings from the bot's configuration. Workers start with the first job."""
+        if workers is not None:
+            self.workers = workers
+
+    async def warm(self) -> float:
+        """Start the workers and wait until one has its YoutubeDL ready, so the first real job
+        doesn't pay for importing yt-dlp. Returns how many seconds that took."""
+        startedAt = time.perf_counter()
+        await self.run(lambda ytdl: None)
+        return time.perf_counter() - startedAt
+
+    def run(self, fn, *, group=None, worker: int | None = None) -> asyncio.Future:
+        """Queue fn(ytdl) to run on a worker and return a future for its result.
+
+        Cancelling the future before a worker picks the job up drops the job. fn runs in a copy
+        of the caller's context, so it logs under the caller's trace ID.
+
+        Args:
+            fn: Called with the worker's YoutubeDL.
+            group: Jobs from the same group are served in order, and groups take turns.
+            worker (int, optional): Only run on this worker, ahead of its other jobs.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job = (fn, future, loop, time.perf_counter(), contextvars.copy_context())
+        self._start_workers()
+        with self._ready:
+            if worker is not None:
+                self._pinned[worker].append(job)
+                self._ready.notify_all()
+            else:
+                self._groups.setdefault(group, deque()).append(job)
+                self._ready.notify()
+            self.depth += 1
+        return future
+
+    def run_shared(self, key, fn, *, group=None, fork=None) -> asyncio.Future:
+        """Like run, but calls with the same key while one is in flight share its job.
+
+        Each caller gets its own future, so cancelling it only stops that caller waiting. The
+        job keeps going for everyone else.
+
+        Args:
+            key: Identifies equivalent work, like a normalized URL.
+            fn: Called with the worker's YoutubeDL.
+            group: Group for the job, if this call starts it.
+            fork (optional): Called as fork(result, n) to split a result that can't be shared
+                as-is between n callers. Defaults to giving everyone the same result.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        waiters = self._inflight.get(key)
+        if waiters is None:
+            waiters = self._inflight[key] = []
+            self.run(fn, group=group).add_done_callback(
+                lambda job: self._settle(key, job, fork)
+            )
+        else:
+            self.coalesced += 1
+        waiters.append(waiter)
+        return waiter
+
+    def _settle(self, key, job: asyncio.Future, fork):
+        waiters = [waiter for waiter in self._inflight.pop(key) if not waiter.done()]
+        if not waiters:
+            return
+        error = job.exception()
+        if error is not None:
+            for waiter in waiters:
+                waiter.set_exception(error)
+            return
+        if fork is not None and len(waiters) > 1:
+            results = fork(job.result(), len(waiters))
+        else:
+            results = [job.result()] * len(waiters)
+        for waiter, result in zip(waiters, results):
+            waiter.set_result(result)
+
+    def current_worker(self) -> int | None:
+        """The index of the worker calling this, to pin follow-up jobs to it."""
+        return getattr(self._local, "index", None)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._threads),
+            "busy": self.busy,
+            "depth": self.depth,
+            "groups": len(self._groups),
+            "completed": self.completed,
+            "coalesced": self.coalesced,
+            "last_wait": self.lastWait,
+            "average_wait": self.averageWait,
+        }
+
+    def _start_workers(self):
+        with self._ready:
+            while len(self._threads) < self.workers:
+                index = len(self._threads)
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(index,),
+                    name=f"extractor-{index}",
+                    daemon=True,
+                )
+                self._threads.append(thread)
+                self._pinned.append(deque())
+                thread.start()
+
+    def _next_job(self, index: int):
+        """Take a job pinned to this worker, or else the oldest job from the group at the front
+        (then send that group to the back)."""
+        pinned = self._pinned[index]
+        with self._ready:
+            while not self._groups and not pinned:
+                self._ready.wait()
+            if pinned:
+                self.depth -= 1
+                return pinned.popleft()
+            group, jobs = next(iter(self._groups.items()))
+            job = jobs.popleft()
+            if jobs:
+                self._groups.move_to_end(group)
+            else:
+                del self._groups[group]
+            self.depth -= 1
+            return job
+
+    def _work(self, index: int):
+        self._local.index = index
+        ytdl = self.factory(self.options)
+        while True:
+            fn, future, loop, queuedAt, context = self._next_job(index)
+            if future.cancelled():
+                continue
+
+            wait = time.perf_counter() - queuedAt
+            with self._ready:
+                self.lastWait = wait
+                self.averageWait = self.averageWait * 0.9 + wait * 0.1
+                self.busy += 1
+            try:
+                result = context.run(fn, ytdl)
+            except Exception as e:
+                loop.call_soon_threadsafe(_resolve, future, None, e)
+            else:
+                loop.call_soon_threadsafe(_resolve, future, result, None)
+            finally:
+                with self._ready:
+                    self.busy -= 1
+                    self.completed += 1
+
+
+def make_ytdl(options: dict):
+    """yt-dlp takes a while to import, so it isn't until a worker first needs it."""
+    from yt_dlp import YoutubeDL
+
+    return YoutubeDL(options)
+
+
+def _resolve(future: asyncio.Future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
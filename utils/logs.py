@@ -0,0 +1,163 @@
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+from contextlib import contextmanager
+
+# The ID of the command invocation the running code is part of, if any. Tasks started while
+# handling a command inherit it, and so do extraction jobs (see ExtractionPool.run).
+traceId: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "traceId", default=None
+)
+
+# Everything logs through the discord logger, so py-cord's own logs end up in the same places
+logger = logging.getLogger("discord")
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+FILE_FORMAT = "[{asctime}] [{levelname:<8}] {name}: {traceTag}{message}"
+
+
+def new_trace() -> str:
+    return secrets.token_hex(4)
+
+
+@contextmanager
+def traced(trace: str | None = None):
+    """Run the with block (and any tasks it starts) under a trace ID, a new one by default."""
+    token = traceId.set(trace or new_trace())
+    try:
+        yield traceId.get()
+    finally:
+        traceId.reset(token)
+
+
+class TraceFilter(logging.Filter):
+    """Tags each record with the trace ID it was logged under, as record.trace (and
+    record.traceTag, ready to put in front of a message)."""
+
+    def filter(self, record):
+        record.trace = traceId.get()
+        record.traceTag = f"[{record.trace}] " if record.trace else ""
+        return True
+
+
+class ConsoleFormatter(logging.Formatter):
+    black = "\x1b[30m"
+    red = "\x1b[31m"
+    green = "\x1b[32m"
+    yellow = "\x1b[33m"
+    blue = "\x1b[34m"
+    gray = "\x1b[38m"
+    reset = "\x1b[0m"
+    bold = "\x1b[1m"
+
+    COLORS = {
+        logging.DEBUG: gray + bold,
+        logging.INFO: blue + bold,
+        logging.WARNING: yellow + bold,
+        logging.ERROR: red,
+        logging.CRITICAL: red + bold,
+    }
+
+    def __init__(self):
+        """Colored levels for the terminal. There's a formatter per level, made up front."""
+        super().__init__()
+        self.formatters = {
+            level: logging.Formatter(
+                f"{self.black}{self.bold}{{asctime}}{self.reset} {color}{{levelname:<8}}"
+                f"{self.reset} {{traceTag}}{{message}}",
+                DATE_FORMAT,
+                style="{",
+            )
+            for level, color in self.COLORS.items()
+        }
+
+    def format(self, record):
+        return self.formatters.get(
+            record.levelno, self.formatters[logging.INFO]
+        ).format(record)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers and jq."""
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if getattr(record, "trace", None):
+            entry["trace"] = record.trace
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        """Merge the message's arguments and render any traceback now, since they might not
+        make it to the listener's thread intact, but leave the formatting to its handlers.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(
+    config: dict, suffix: str | None = None
+) -> logging.handlers.QueueListener:
+    """Log to the console and a rotating file from a background thread, so writing logs never
+    blocks the event loop. Stop the returned listener on shutdown to flush what's left.
+
+    The previous run's log is rolled over on startup, so the current file is just this run.
+
+    Args:
+        config (dict): The "logging" section of the configuration.
+        suffix (str, optional): Added to the file name, to keep processes' logs apart.
+    """
+    path = config.get("path") or "discord.log"
+    if suffix:
+        root, ext = os.path.splitext(path)
+        path = f"{root}-{suffix}{ext}"
+    fileHandler = logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=config.get("max_bytes", 10 * 1024 * 1024),
+        backupCount=config.get("backups", 5),
+        encoding="utf-8",
+        delay=True,
+    )
+    if os.path.exists(path) and os.path.getsize(path):
+        fileHandler.doRollover()
+    if config.get("format") == "json":
+        fileHandler.setFormatter(JSONFormatter())
+    else:
+        fileHandler.setFormatter(logging.Formatter(FILE_FORMAT, DATE_FORMAT, style="{"))
+
+    consoleHandler = logging.StreamHandler()
+    consoleHandler.setFormatter(ConsoleFormatter())
+
+    records = queue.SimpleQueue()
+    handler = BackgroundHandler(records)
+    # on the logging thread, where the trace ID is known
+    handler.addFilter(TraceFilter())
+    logger.addHandler(handler)
+    logger.setLevel(config.get("level", "INFO"))
+
+    listener = logging.handlers.QueueListener(records, fileHandler, consoleHandler)
+    listener.start()
+    return listener
@@ -0,0 +1,138 @@
+import threading
+from bisect import bisect_left
+
+# Seconds; covers everything from a cached hit to a slow playlist page
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metric:
+    def __init__(self, name: str, help: str, kind: str):
+        self.name = name
+        self.help = help
+        self.kind = kind
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+        ] + [
+            f"{self.name}{suffix} {format_value(value)}"
+            for suffix, value in self.samples()
+        ]
+
+    def samples(self):
+        """(name suffix with labels, value) pairs."""
+        raise NotImplementedError
+
+
+class Gauge(Metric):
+    def __init__(self, name, help, collect=None):
+        """A value that goes up and down. collect is called for the value when the metrics are
+        scraped; until it's set, the gauge reads 0."""
+        super().__init__(name, help, "gauge")
+        self.collect = collect
+
+    def samples(self):
+        return [("", self.collect() if self.collect else 0)]
+
+
+class Histogram(Metric):
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        """Counts observations into cumulative buckets. Safe to observe from any thread."""
+        super().__init__(name, help, "histogram")
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            samples.append((f'_bucket{{le="{bound}"}}', cumulative))
+        return samples + [("_sum", total), ("_count", cumulative)]
+
+
+class Registry:
+    def __init__(self):
+        """Every metric the bot exposes, rendered in the Prometheus text format."""
+        self.metrics: list[Metric] = []
+
+    def gauge(self, name, help, collect=None) -> Gauge:
+        return self._add(Gauge(name, help, collect))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+def format_value(value) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = Registry()
+
+extractInfoSeconds = registry.histogram(
+    "cadence_extract_info_seconds", "Time spent in yt-dlp extract_info."
+)
+processInfoSeconds = registry.histogram(
+    "cadence_process_ie_result_seconds",
+    "Time spent in yt-dlp process_ie_result resolving streams.",
+)
+firstAudioSeconds = registry.histogram(
+    "cadence_play_to_first_audio_seconds",
+    "Time from a play command that starts playback to the first audio packet.",
+)
+trackGapSeconds = registry.histogram(
+    "cadence_track_gap_seconds",
+    "Silence between one track ending and the next queued track's first audio packet.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+loopLagSeconds = registry.histogram(
+    "cadence_event_loop_lag_seconds",
+    "How late the event loop ran a timer it was asked to run.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+# Gauges read from the players and extraction pool when scraped; MetricsCog sets their collect
+players = registry.gauge("cadence_players", "Guild players (GuildQueues) that exist.")
+playing = registry.gauge("cadence_players_playing", "Guild players playing something.")
+ffmpegProcesses = registry.gauge(
+    "cadence_ffmpeg_processes", "FFmpeg processes feeding voice clients."
+)
+queuedTracks = registry.gauge(
+    "cadence_queued_tracks", "Upcoming tracks across every guild's queue."
+)
+longestQueue = registry.gauge(
+    "cadence_queue_length_max", "Upcoming tracks in the longest guild queue."
+)
+extractionWorkers = registry.gauge(
+    "cadence_extraction_workers", "Threads in the extraction pool."
+)
+extractionBusy = registry.gauge(
+    "cadence_extraction_busy_workers", "Extraction threads running a job."
+)
+extractionBacklog = registry.gauge(
+    "cadence_extraction_backlog", "Extraction jobs waiting for a thread."
+)
+extractionWait = registry.gauge(
+    "cadence_extraction_wait_seconds", "Average time extraction jobs wait for a thread."
+)
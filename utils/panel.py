@@ -0,0 +1,234 @@
+import asyncio
+import time
+
+import discord
+
+from utils.logs import logger
+
+# Longest the scheduler sleeps before checking panels for changes
+POLL_INTERVAL = 1
+# Most seconds to wait before retrying a panel whose edits keep failing
+MAX_BACKOFF = 300
+
+
+class EditScheduler:
+    def __init__(self, interval: float = 10, min_gap: float = 2, rate: float = 5):
+        """Keeps every guild's now playing panel up to date, from one task.
+
+        A panel is edited when what it shows changes, or every interval seconds while it's
+        playing, for the progress. Changes are coalesced: a panel is edited at most once per
+        min_gap seconds, showing whatever the player's state is by then, so five skips in a row
+        are one edit. Edits across all panels are spaced to at most rate per second, well
+        under Discord's global limit, and min_gap keeps each channel under its own.
+
+        Args:
+            interval (float): Seconds between progress updates. Defaults to 10.
+            min_gap (float): Fewest seconds between edits of one panel. Defaults to 2.
+            rate (float): Most edits per second, across every panel. Defaults to 5.
+        """
+        self.interval = interval
+        self.minGap = min_gap
+        self.spacing = 1 / rate
+        self.panels: set[NowPlayingPanel] = set()
+        self.task: asyncio.Task | None = None
+        self._editedAt = 0.0  # last edit of any panel
+
+    def add(self, panel):
+        self.panels.add(panel)
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def discard(self, panel):
+        self.panels.discard(panel)
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def due(self, panel) -> float | None:
+        """When the panel should be edited next (a time.monotonic()), if at all."""
+        if panel.state() != panel.shown:
+            due = panel.editedAt + self.minGap
+        elif panel.playing():
+            due = panel.editedAt + self.interval
+        else:
+            return None
+        return max(due, panel.retryAt)
+
+    async def run(self):
+        while True:
+            panel, due = None, None
+            for candidate in list(self.panels):
+                candidateDue = self.due(candidate)
+                if candidateDue is not None and (due is None or candidateDue < due):
+                    panel, due = candidate, candidateDue
+
+            now = time.monotonic()
+            if panel is not None:
+                due = max(due, self._editedAt + self.spacing)
+            if panel is None or due > now:
+                # states change without telling us, so check back within POLL_INTERVAL
+                await asyncio.sleep(
+                    min(due - now, POLL_INTERVAL) if due else POLL_INTERVAL
+                )
+                continue
+
+            self._editedAt = now
+            try:
+                await panel.refresh()
+                panel.failures = 0
+            except (discord.NotFound, discord.Forbidden):
+                # the message was deleted, or we can't see the channel any more
+                await panel.close()
+            except Exception as e:
+                # try again, waiting longer after each failure in a row
+                panel.failures += 1
+                panel.shown = None
+                panel.retryAt = now + min(
+                    self.minGap * 2**panel.failures, MAX_BACKOFF
+                )
+                logger.warning(f"Couldn't update a now playing panel: {e}")
+
+
+class NowPlayingPanel(discord.ui.View):
+    LOOP_MODES = ["Off", "Queue", "Track"]
+
+    def __init__(self, queue, scheduler):
+        """A now playing message that keeps itself up to date, with buttons to control the player.
+
+        It shows the track's progress, what's next, the loop mode and the volume. The
+        EditScheduler edits it when any of that changes, and every so often while playing.
+
+        Usage:
+            panel = NowPlayingPanel(queue, scheduler)
+            await panel.respond(ctx)
+
+        Args:
+            queue (GuildQueue): The player to show and control.
+            scheduler (EditScheduler): Decides when the message is edited.
+        """
+        super().__init__(timeout=None)
+        self.queue = queue
+        self.scheduler = scheduler
+        self.message: discord.Message | None = None
+        self.postedAt = 0.0
+        self.editedAt = 0.0
+        self.shown = None  # the state() last rendered
+        self.failures = 0  # edits that failed in a row
+        self.retryAt = 0.0  # don't edit before this, after a failure
+        self.children: list[discord.ui.Button]
+
+    def paused(self) -> bool:
+        client = self.queue.guild.voice_client
+        return client is not None and client.is_paused()
+
+    def playing(self) -> bool:
+        """Is the progress moving, so it needs updating now and then?"""
+        return self.queue.nowPlaying is not None and not self.paused()
+
+    def state(self):
+        """Everything the panel shows, other than progress."""
+        return (
+            self.queue.nowPlaying,
+            self.paused(),
+            self.queue.loopMode,
+            self.queue.peek_next(),
+            self.queue.volume,
+        )
+
+    def render(self) -> discord.Embed:
+        self.shown = self.state()
+        track, paused, loopMode, nextUp, volume = self.shown
+        self.pause.emoji = "▶️" if paused else "⏸️"
+        self.loop.label = f"Loop: {self.LOOP_MODES[loopMode]}"
+        if track is None:
+            return discord.Embed(
+                description="Nothing's playing right now", color=0xC84268
+            )
+
+        embed = track.to_embed(progress=int(self.queue.progress()), playing=True)
+        if paused:
+            embed.set_author(name="Paused")
+        embed.add_field(name="Up next", value=nextUp.title if nextUp else "Nothing")
+        embed.add_field(name="Loop", value=self.LOOP_MODES[loopMode])
+        embed.add_field(name="Volume", value=f"{round(volume * 100)}%")
+        return embed
+
+    async def respond(self, ctx):
+        response = await ctx.respond(embed=self.render(), view=self)
+        if isinstance(response, discord.Interaction):
+            response = await response.original_response()
+        self.message = response
+        self.postedAt = self.editedAt = time.monotonic()
+        self.scheduler.add(self)
+
+    async def refresh(self):
+        """Edit the message to show the player as it is now."""
+        self.editedAt = time.monotonic()
+        await self.message.edit(embed=self.render(), view=self)
+
+    async def close(self, delete: bool = False):
+        """Stop updating the message, and either delete it or leave it with the buttons off."""
+        self.scheduler.discard(self)
+        self.stop()
+        if self.message is None:
+            return
+        try:
+            if delete:
+                await self.message.delete()
+            else:
+                for item in self.children:
+                    item.disabled = True
+                await self.message.edit(
+                    embed=discord.Embed(description="Stopped playing", color=0xC84268),
+                    view=self,
+                )
+        except discord.HTTPException:
+            pass
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        client = self.queue.guild.voice_client
+        voice = interaction.user.voice
+        if voice is None or client is None or voice.channel != client.channel:
+            await interaction.response.send_message(
+                "You're not in the same voice channel as me!", ephemeral=True
+            )
+            return False
+        return True
+
+    async def _show(self, interaction: discord.Interaction):
+        self.editedAt = time.monotonic()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(emoji="⏸️", style=discord.ButtonStyle.blurple)
+    async def pause(self, button, interaction):
+        if self.queue.nowPlaying is None:
+            await interaction.response.send_message(
+                "I'm not playing anything right now", ephemeral=True
+            )
+            return
+        if self.paused():
+            self.queue.resume()
+        else:
+            self.queue.pause()
+        await self._show(interaction)
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.blurple)
+    async def skip(self, button, interaction):
+        if self.queue.nowPlaying is None or self.queue.queue.empty():
+            await interaction.response.send_message(
+                "The queue is empty!", ephemeral=True
+            )
+            return
+        self.queue.skip()
+        # the next track shows up once it's started
+        await self._show(interaction)
+
+    @discord.ui.button(label="Loop: Off", emoji="🔁", style=discord.ButtonStyle.gray)
+    async def loop(self, button, interaction):
+        # off, then queue, then track, then off again
+        [self.queue.repeat_queue, self.queue.repeat_track, self.queue.repeat_off][
+            self.queue.loopMode
+        ]()
+        await self._show(interaction)
@@ -1,16 +1,305 @@
-from utils.track import ActiveTrack, QueuedTrack
+from utils.audio import FrameCounter, TrackMixer
+from utils.logs import traceId
+from utils.metrics import Histogram, trackGapSeconds
+from utils.search import playedIndex
+from utils.track import ActiveTrack, PlaylistLoader, QueuedTrack, audioCache
 import discord
 import asyncio
+import time
+from bisect import bisect_right
+from itertools import accumulate
 from random import shuffle
-import datetime
 
 
-class Playlist(asyncio.Queue):
+# Target number of tracks per TrackList chunk
+CHUNK_SIZE = 256
+# Seconds before a track ends (or starts crossfading) to open the next track's source
+HANDOFF_LEAD = 5
+# Longest to wait for a pre-opened source's first frame
+PRIME_TIMEOUT = 10
+# Most queries add_urls resolves at once, by default, leaving workers free for other guilds
+BULK_CONCURRENCY = 3
+
+
+class TrackList:
+    def __init__(self, items=()):
+        """A list stored as a run of small chunks.
+
+        Indexing is a bisect over the chunk offsets, and inserting or deleting only shifts one
+        chunk, so edits anywhere in a 10k+ track queue cost O(CHUNK_SIZE + chunks) rather than
+        O(n). Reads and writes at either end touch a single chunk.
+        """
+        self._chunks: list[list] = []
+        self._starts: list[
+            int
+        ] | None = []  # index of each chunk's first item, None if stale
+        self._len = 0
+        self.extend(items)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def _locate(self, index: int):
+        """Return (chunk number, offset in chunk) for an index."""
+        if index < 0:
+            index += self._len
+        if index < 0 or index >= self._len:
+            raise IndexError("TrackList index out of range")
+        first = len(self._chunks[0])
+        if index < first:
+            return 0, index
+        last = self._len - len(self._chunks[-1])
+        if index >= last:
+            return len(self._chunks) - 1, index - last
+
+        if self._starts is None:
+            self._starts = list(
+                accumulate((len(c) for c in self._chunks[:-1]), initial=0)
+            )
+        chunk = bisect_right(self._starts, index) - 1
+        return chunk, index - self._starts[chunk]
+
+    def __getitem__(self, index: int):
+        chunk, offset = self._locate(index)
+        return self._chunks[chunk][offset]
+
+    def __setitem__(self, index: int, item):
+        chunk, offset = self._locate(index)
+        self._chunks[chunk][offset] = item
+
+    def append(self, item):
+        if not self._chunks or len(self._chunks[-1]) >= CHUNK_SIZE:
+            self._chunks.append([])
+            self._starts = None
+        self._chunks[-1].append(item)
+        self._len += 1
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def insert(self, index: int, item):
+        if index >= self._len:
+            return self.append(item)
+        chunk, offset = self._locate(max(index, 0))
+        self._chunks[chunk].insert(offset, item)
+        self._len += 1
+        if len(self._chunks[chunk]) > CHUNK_SIZE * 2:
+            # split big chunks so inserts stay cheap
+            half = self._chunks[chunk][CHUNK_SIZE:]
+            del self._chunks[chunk][CHUNK_SIZE:]
+            self._chunks.insert(chunk + 1, half)
+        self._starts = None
+
+    def insert_many(self, index: int, items):
+        """Insert items in order before index, shifting the chunk there once for all of them."""
+        items = list(items)
+        if index >= self._len:
+            return self.extend(items)
+        chunk, offset = self._locate(max(index, 0))
+        merged = self._chunks[chunk]
+        merged[offset:offset] = items
+        self._len += len(items)
+        if len(merged) > CHUNK_SIZE * 2:
+            self._chunks[chunk : chunk + 1] = [
+                merged[i : i + CHUNK_SIZE] for i in range(0, len(merged), CHUNK_SIZE)
+            ]
+        self._starts = None
+
+    def pop(self, index: int = -1):
+        chunk, offset = self._locate(index)
+        item = self._chunks[chunk].pop(offset)
+        self._len -= 1
+        if not self._chunks[chunk]:
+            del self._chunks[chunk]
+        self._starts = None
+        return item
+
+    def delete(self, start: int, stop: int):
+        """Delete items [start, stop). Chunks entirely inside the range are dropped whole."""
+        start, stop = max(start, 0), min(stop, self._len)
+        if start >= stop:
+            return
+        firstChunk, firstOffset = self._locate(start)
+        lastChunk, lastOffset = self._locate(stop - 1)
+        if firstChunk == lastChunk:
+            del self._chunks[firstChunk][firstOffset : lastOffset + 1]
+        else:
+            del self._chunks[lastChunk][: lastOffset + 1]
+            del self._chunks[firstChunk][firstOffset:]
+            del self._chunks[firstChunk + 1 : lastChunk]
+        self._chunks = [c for c in self._chunks if c]
+        self._len -= stop - start
+        self._starts = None
+
+    def slice(self, start: int, stop: int) -> list:
+        """Copy out items [start, stop) without walking the rest of the list."""
+        start, stop = max(start, 0), min(stop, self._len)
+        items = []
+        if start >= stop:
+            return items
+        chunk, offset = self._locate(start)
+        while len(items) < stop - start:
+            items.extend(
+                self._chunks[chunk][offset : offset + stop - start - len(items)]
+            )
+            chunk, offset = chunk + 1, 0
+        return items
+
+    def shuffle(self, start: int = 0):
+        """Shuffle items from start to the end, in place."""
+        tail = self.slice(start, self._len)
+        shuffle(tail)
+        self.delete(start, self._len)
+        self.extend(tail)
+
+
+class Playlist:
+    def __init__(self):
+        """Every track queued in a guild, in play order, with a cursor at the next one to play.
+
+        Tracks before the cursor are history, so looping the queue is just moving the cursor back
+        to the start. Positions taken by the editing methods are relative to the cursor: 0 is
+        the next track up.
+        """
+        self.tracks = TrackList()
+        self.cursor = 0
+        # bumped by every edit except appending, so snapshots know when they can just append
+        self.revision = 0
+        self._added = asyncio.Event()
+
+    def __len__(self):
+        """How many tracks are left to play."""
+        return len(self.tracks) - self.cursor
+
+    def empty(self):
+        return len(self) == 0
+
+    def put_nowait(self, track):
+        self.tracks.append(track)
+        self._added.set()
+
+    async def put(self, track):
+        self.put_nowait(track)
+
+    def insert(self, position: int, track):
+        self.tracks.insert(self.cursor + max(position, 0), track)
+        self.revision += 1
+        self._added.set()
+
+    def insert_many(self, position: int, tracks):
+        """Insert tracks in order at position, or append them if that's past the end."""
+        index = self.cursor + max(position, 0)
+        if index < len(self.tracks):
+            self.revision += 1
+        self.tracks.insert_many(index, tracks)
+        self._added.set()
+
+    async def get(self):
+        """Wait for a track, return it and move the cursor past it."""
+        while self.empty():
+            self._added.clear()
+            await self._added.wait()
+        track = self.tracks[self.cursor]
+        self.cursor += 1
+        return track
+
+    def peek(self, position: int = 0):
+        return self.tracks[self.cursor + position]
+
+    def upcoming(self, start: int = 0, stop: int | None = None) -> list:
+        """Copy out the upcoming tracks in [start, stop)."""
+        if stop is None:
+            stop = len(self)
+        return self.tracks.slice(self.cursor + start, self.cursor + stop)
+
+    def history_length(self):
+        return self.cursor
+
+    def _check(self, position: int):
+        if position < 0 or position >= len(self):
+            raise IndexError("There's no track at that position in the queue")
+
+    def remove(self, position: int):
+        self._check(position)
+        self.revision += 1
+        return self.tracks.pop(self.cursor + position)
+
+    def remove_range(self, start: int, stop: int):
+        """Remove the upcoming tracks in [start, stop)."""
+        self._check(start)
+        self.revision += 1
+        self.tracks.delete(self.cursor + start, self.cursor + min(stop, len(self)))
+
+    def move(self, source: int, destination: int):
+        self._check(source)
+        self._check(destination)
+        self.revision += 1
+        track = self.tracks.pop(self.cursor + source)
+        self.tracks.insert(self.cursor + destination, track)
+        return track
+
+    def skip_to(self, position: int):
+        """Move the cursor forward so the track at position is next. Skipped tracks become history."""
+        self._check(position)
+        self.cursor += position
+
+    def rewind(self):
+        """Start playing from the first track again."""
+        self.cursor = 0
+
+    def replay(self):
+        """Move the cursor back one track so the last one is played again."""
+        self.cursor = max(self.cursor - 1, 0)
+
     def shuffle(self):
-        shuffle(self._queue)
+        """Shuffle the upcoming tracks."""
+        self.tracks.shuffle(self.cursor)
+        self.revision += 1
+
+
+class Handoff:
+    __slots__ = ("track", "source", "index")
+
+    def __init__(self, track: ActiveTrack, source: FrameCounter, index: int):
+        """The next track's source, opened early and queued in the player's TrackMixer.
+
+        Args:
+            track (ActiveTrack): The track that plays next.
+            source (FrameCounter): Its source, already primed.
+            index (int): Where track is in queue.tracks.
+        """
+        self.track = track
+        self.source = source
+        self.index = index
+
+
+class BulkLoader:
+    def __init__(self, queries: list[str]):
+        """add_urls' progress through a list of queries, like PlaylistLoader's for a playlist.
+
+        Args:
+            queries (list[str]): The URLs or searches, in the order they're queued.
+        """
+        self.queries = queries
+        # per query so far: (tracks, PlaylistLoader or None), or the exception it failed with
+        self.results: list = []
+        self.task: asyncio.Task | None = None  # set by add_urls
+
+    @property
+    def loaded(self) -> int:
+        """How many tracks have been queued so far, including playlists still loading."""
+        return sum(
+            loader.loaded if loader is not None else len(tracks)
+            for tracks, loader in self.successes()
+        )
 
-    def peek(self):
-        return self._queue[0]
+    def successes(self) -> list[tuple]:
+        return [result for result in self.results if not isinstance(result, Exception)]
 
 
 class GuildQueue:
@@ -23,64 +312,309 @@ class GuildQueue:
         self.queue: Playlist = Playlist()
         self.readyForNext = asyncio.Event()
         self.nowPlaying: ActiveTrack | None = None
-        self._startedTime: float | None = None
-        self._progress: float | None = None
-        self.history: Playlist = Playlist()
-
+        self._skipping = False
+        self.resumeAt = 0  # where to start the next track, for restored players
+        # the histogram and start time the next track's first audio packet is timed for
+        self._audioTimer: tuple[Histogram, float] | None = None
+        self.loaders: set[PlaylistLoader | BulkLoader] = set()  # cancelled on cleanup
+        self.panel = None  # the NowPlayingPanel, if someone's asked for one
+
+        # what the voice client is playing, and the next track queued in it
+        self.mixer: TrackMixer | None = None
+        self.handoff: Handoff | None = None
+        self._handedOff = False  # the mixer has switched to the handoff's track
+        self._preopened = False  # the next track's been opened (or tried) for this one
+
+        playback = ctx.bot.config.get("playback", {})
         self.loopMode = 0  # 0 = off, 1 = loop queue, 2 = loop track
-        self.volume = 0.5
+        self.volume = playback.get("default_volume", 0.5)
+        # open the next track before this one ends and switch without a gap
+        self.gapless = playback.get("gapless", True)
+        self.crossfade = playback.get("crossfade", 0) if self.gapless else 0
+        # send Opus streams to Discord as-is when the volume is 100% (crossfades need PCM).
+        # Players start at default_volume, so with the default of 50% this only kicks in once
+        # someone turns the volume up to 100%.
+        self.passthrough = playback.get("passthrough", True) and not self.crossfade
+        self.bulkConcurrency = playback.get("bulk_concurrency", BULK_CONCURRENCY)
+
+        self.task: asyncio.Task = self.start()
+
+    def start(self) -> asyncio.Task:
+        """Start the player loop, stopping anything a previous (crashed) loop left playing."""
+        client = self.guild.voice_client
+        if client and client.is_playing():
+            client.stop()
+        self.handoff = None
+        self._handedOff = False
+        self.mixer = None
+        if self.nowPlaying is not None:
+            self.nowPlaying.cleanup()
+            self.nowPlaying = None
+        self.task = self._bot.loop.create_task(self.player_loop())
+        return self.task
 
-        self.task = ctx.bot.loop.create_task(self.player_loop())
+    def is_idle(self):
+        """Is nothing playing right now (including while paused)?"""
+        client = self.guild.voice_client
+        return client is None or not client.is_playing()
+
+    def is_paused(self):
+        """Is a track paused, waiting to be resumed?"""
+        client = self.guild.voice_client
+        return client is not None and client.is_paused()
 
     async def player_loop(self):
         """The player loop."""
         await self._bot.wait_until_ready()
 
+        track = None
         while not self._bot.is_closed():
-            self.readyForNext.clear()
-            queueItem = await self.get_next()
-            source = queueItem
-
-            if not isinstance(source, discord.PCMVolumeTransformer):
-                try:
-                    source = await source.to_active_track(loop=self._bot.loop)
-                except Exception as e:
-                    await self.channel.send(
-                        # TODO: better embed (color?)
-                        embed=discord.Embed(
-                            title="Error",
-                            description=f"```{e}```",
-                            color=discord.Color.red(),
-                        )
-                    )
+            if self._handedOff:
+                # the mixer's already playing the next track
+                track = self._take_handoff(track)
+            else:
+                self.readyForNext.clear()
+                track = await self._play_next()
+                if track is None:
                     continue
 
-            source.volume = self.volume
-            self.nowPlaying = source
+            # keep a local copy for loops, and get the next tracks ready so there's less delay
+            track.stream.prefetch()
+            try:
+                await self._prepare_upcoming()
+            except Exception as e:
+                # it'll get another try when it comes up
+                self._bot.logger.warning(f"Couldn't pre-activate upcoming tracks: {e}")
+
+            # wait until the player is ready for the next track
+            await self._wait_for_end(track)
+            if self._handedOff:
+                continue
+            self._drop_handoff()
+            if self._audioTimer is None and self._next_index() is not None:
+                # the next track's already queued, so any silence from here on is a gap
+                self._audioTimer = (trackGapSeconds, time.perf_counter())
 
-            def after(error):
-                if error:
-                    raise error
-                self._bot.loop.call_soon_threadsafe(self.readyForNext.set)
+            # Clean up FFmpeg after the track has finished
+            track.cleanup()
+            self.nowPlaying = None
 
-            self.guild.voice_client.play(
-                source,
-                after=after,
+    async def _play_next(self):
+        """Start the next track from scratch. Returns it, or None if it couldn't be played."""
+        track = await self.get_next()
+        index = self.queue.cursor - 1
+        start, self.resumeAt = self.resumeAt, 0
+        # the track's logs belong to the command that queued it
+        traceId.set(track.trace)
+
+        try:
+            track = await self._activate(track)
+        except Exception as e:
+            await self.channel.send(
+                # TODO: better embed (color?)
+                embed=discord.Embed(
+                    title="Error",
+                    description=f"```{e}```",
+                    color=discord.Color.red(),
+                )
             )
-            self._startedTime = datetime.datetime.now().timestamp()
-            self._progress = 0
+            # don't retry it forever if we're looping this track
+            self._skipping = True
+            return None
 
-            # if there's another queued track after this one, activate it so there's less delay.
-            # TODO: this is nice but what happens when someone shuffles the queue? the stream could expire if the activated track's tossed too far back. implement a way to refresh the stream url?
-            await self._activate_next_track()
+        # played tracks stay put, so keep the resolved stream around for loops
+        self.queue.tracks[index] = track
+        self._set_now_playing(track)
 
-            # wait until the player is ready for the next track
-            await self.readyForNext.wait()
-            await self.history.put(queueItem)
+        # FFmpeg is only spawned now, right before playback
+        self._bot.logger.info(
+            f"Starting FFmpeg for {track.web_url} in guild {self.guild.id}"
+        )
+        self.mixer = TrackMixer(
+            track.open(self.volume, self.passthrough, start, self._on_first_audio),
+            on_switch=self._on_switch,
+            on_finished=self._on_finished,
+        )
+        self.guild.voice_client.play(self.mixer, after=self._after)
+        return track
+
+    async def _activate(self, track: QueuedTrack) -> ActiveTrack:
+        """Resolve the track's stream, if it isn't already (or has gone stale)."""
+        if not isinstance(track, ActiveTrack):
+            return await track.to_active_track(loop=self._bot.loop, group=self.guild.id)
+        if track.is_stale():
+            # pre-activated a while ago (shuffled back, looped, etc.)
+            await track.refresh(group=self.guild.id)
+        return track
+
+    def _set_now_playing(self, track: ActiveTrack):
+        self.nowPlaying = track
+        self._preopened = False
+        playedIndex.add(self.guild.id, track.title, track.web_url)
+
+    def _after(self, error):
+        # from the player thread, once the voice client has stopped playing the mixer
+        if error:
+            self._bot.logger.error(
+                f"Player error in guild {self.guild.id}", exc_info=error
+            )
+        if self.mixer is not None:
+            self.mixer.done = True
+        self._bot.loop.call_soon_threadsafe(self.readyForNext.set)
+
+    def _on_switch(self, old: FrameCounter):
+        # from the player thread, right before the next track's first frame is read
+        self._audioTimer = (trackGapSeconds, time.perf_counter())
+        self._bot.loop.call_soon_threadsafe(self._switched)
+
+    def _switched(self):
+        if self.handoff is not None:
+            self._handedOff = True
+            self.readyForNext.set()
+
+    def _on_finished(self, source: FrameCounter):
+        # from the player thread; stopping FFmpeg can block for a moment
+        self._bot.loop.call_soon_threadsafe(self._discard_source, source)
+
+    def _discard_source(
+        self, source: discord.AudioSource, after: asyncio.Future | None = None
+    ):
+        """Clean up a source in the executor, once after (its priming, say) is done."""
+        if after is not None and not after.done():
+            after.add_done_callback(lambda _: self._discard_source(source))
+            return
+        self._bot.loop.run_in_executor(None, source.cleanup)
+
+    async def _wait_for_end(self, track: ActiveTrack):
+        """Wait for the track to finish (or be handed off), opening the next one's source
+        HANDOFF_LEAD seconds before it's needed."""
+        lead = self.crossfade + HANDOFF_LEAD
+        preopening: asyncio.Task | None = None
+        try:
+            while not self.readyForNext.is_set():
+                left = track.duration - track.position() if track.duration else None
+                if not self.gapless or left is None:
+                    await self.readyForNext.wait()
+                    break
+                if left <= lead and not self._preopened:
+                    self._preopened = True
+                    # in the background, so the track ending while it's primed isn't missed
+                    preopening = self._bot.loop.create_task(self._preopen(track))
+                    preopening.add_done_callback(self._preopened_done)
+                    continue
+                # check back now and then, since seeking moves the end
+                try:
+                    await asyncio.wait_for(
+                        self.readyForNext.wait(), min(max(left - lead, 0.1), 1)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if preopening is not None and not preopening.done():
+                # the track ended first; the next one's started normally
+                preopening.cancel()
+
+    def _preopened_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self._bot.logger.warning(
+                f"Couldn't open the next track early: {task.exception()}"
+            )
 
-            # Clean up FFmpeg after the track has finished
-            source.cleanup()
-            self.nowPlaying = None
+    def _handoff_state(self):
+        # everything that decides which track's next; safe to call from the player thread
+        return (
+            self.queue.revision,
+            self.queue.cursor,
+            self.queue.empty(),
+            self.loopMode,
+            self._skipping,
+        )
+
+    async def _preopen(self, track: ActiveTrack):
+        """Open and prime the next track's source, and queue it in the mixer to take over from
+        track. The mixer only switches if the queue hasn't changed since."""
+        index, mixer = self._next_index(), self.mixer
+        if index is None or mixer is None or mixer.done:
+            return
+        state = self._handoff_state()
+        # the current track's done with, as far as logging goes
+        traceId.set(self.queue.tracks[index].trace)
+        nextTrack = await self._activate(self.queue.tracks[index])
+        if self._handoff_state() != state or self.readyForNext.is_set():
+            # edited or ended while resolving, it'll be started normally
+            return
+        self.queue.tracks[index] = nextTrack
+        if nextTrack.can_passthrough(self.volume, self.passthrough) != mixer.is_opus():
+            # Opus and PCM sources can't share a mixer
+            return
+
+        self._bot.logger.info(
+            f"Starting FFmpeg early for {nextTrack.web_url} in guild {self.guild.id}"
+        )
+        source = nextTrack.new_source(
+            self.volume, self.passthrough, 0, self._on_first_audio
+        )
+        # shielded, so giving up on it doesn't clean up the source while it's being read
+        priming = self._bot.loop.run_in_executor(None, source.prime)
+        try:
+            primed = await asyncio.wait_for(asyncio.shield(priming), PRIME_TIMEOUT)
+        except asyncio.TimeoutError:
+            primed = False
+        except asyncio.CancelledError:
+            self._discard_source(source, after=priming)
+            raise
+        if (
+            not primed
+            or self._handoff_state() != state
+            or self.mixer is not mixer
+            or mixer.done
+        ):
+            self._discard_source(source, after=priming)
+            return
+
+        self.handoff = Handoff(nextTrack, source, index)
+        mixer.queue(
+            source,
+            self.crossfade,
+            fade_at=track.duration - self.crossfade,
+            check=lambda: self._handoff_state() == state,
+        )
+
+    def _take_handoff(self, previous: ActiveTrack) -> ActiveTrack:
+        """Make the track the mixer switched to the playing one, and move the queue on to it
+        like get_next would have. Returns it."""
+        handoff, self.handoff, self._handedOff = self.handoff, None, False
+        self.readyForNext.clear()
+        if self.mixer.done:
+            # stopped right after switching
+            self.readyForNext.set()
+        # the mixer cleans up the previous source once it's played (or faded) out
+        previous.source = None
+        if (
+            handoff.index < len(self.queue.tracks)
+            and self.queue.tracks[handoff.index] is handoff.track
+        ):
+            self.queue.cursor = handoff.index + 1
+        handoff.track.source = handoff.source
+        self._set_now_playing(handoff.track)
+        traceId.set(handoff.track.trace)
+        return handoff.track
+
+    def _drop_handoff(self):
+        """Forget the pre-opened next track. The mixer cleans up its source."""
+        if self.handoff is not None:
+            self.handoff = None
+            self.mixer.drop_upcoming()
+
+    def time_first_audio(self, histogram: Histogram, since: float):
+        """Observe the time from since (a perf_counter) until the next track's first packet."""
+        self._audioTimer = (histogram, since)
+
+    def _on_first_audio(self):
+        timer, self._audioTimer = self._audioTimer, None
+        if timer is not None:
+            histogram, since = timer
+            histogram.observe(time.perf_counter() - since)
 
     def shuffle(self):
         """Shuffle the queue."""
@@ -99,48 +633,128 @@ class GuildQueue:
         self.loopMode = 2
 
     def set_volume(self, volume: float):
-        """Set the volume."""
+        """Set the volume, including for the track that's playing now."""
         if volume < 0 or volume > 1:
             raise ValueError("Volume must be between 0 and 1, inclusive")
         self.volume = volume
 
+        track = self.nowPlaying
+        if track is None or track.source is None:
+            return
+        if track.is_passthrough() != track.can_passthrough(volume, self.passthrough):
+            # switching between passthrough and PCM needs a new FFmpeg
+            self._restart_source()
+        else:
+            # RampingVolume eases into the new volume
+            track.set_volume(volume)
+            if self.handoff is not None and not self.handoff.source.is_opus():
+                self.handoff.source.original.volume = volume
+
+    def _restart_source(self, start: float | None = None):
+        """Swap the playing track's source for a fresh one, at start or the current position."""
+        client = self.guild.voice_client
+        if start is None:
+            start = self.progress()
+        self._drop_handoff()
+        # seeking moves the end, so the next track gets opened again when it's near
+        self._preopened = False
+        source = self.nowPlaying.reopen(self.volume, self.passthrough, start)
+        old, self.mixer = self.mixer, TrackMixer(
+            source, self._on_switch, self._on_finished
+        )
+        paused = client.is_paused()
+        client.source = self.mixer
+        if paused:
+            # swapping sources unpauses the player
+            client.pause()
+        # the player thread could still be reading from the old mixer for a moment
+        self._bot.loop.call_later(1, self._discard_source, old)
+
     def pause(self):
         self.guild.voice_client.pause()
-        self._progress += datetime.datetime.now().timestamp() - self._startedTime
 
     def resume(self):
         self.guild.voice_client.resume()
-        self._startedTime = datetime.datetime.now().timestamp()
 
     def progress(self):
-        return self._progress + datetime.datetime.now().timestamp() - self._startedTime
+        """Seconds into the current track."""
+        return self.nowPlaying.position() if self.nowPlaying is not None else 0
+
+    def seek(self, position: float):
+        """Jump to a position in the current track, reusing its resolved stream."""
+        duration = self.nowPlaying.duration
+        if position < 0 or (duration and position >= duration):
+            raise ValueError("Position must be within the track")
+        self._restart_source(start=position)
+
+    def skip(self):
+        """Stop the current track and move on, even if it's looping."""
+        self._drop_handoff()
+        self._skipping = True
+        self.guild.voice_client.stop()
+
+    def skip_to(self, position: int):
+        """Skip to the track at position (0 is the next track)."""
+        self.queue.skip_to(position)
+        self.skip()
 
     async def get_next(self):
         """Gets the next track while handling looped queues."""
-        if self.loopMode == 2 and self.queue._queue[0] is not None:
-            return self.queue._queue[0]
-        elif self.loopMode == 1 and self.queue.empty() and not self.history.empty():
-            # If the queue is empty, but there are items in the history, move the history to the queue
-            self.queue = self.history
-            self.history = Playlist()
+        skipping, self._skipping = self._skipping, False
+        if self.loopMode == 2 and not skipping and self.queue.history_length():
+            self.queue.replay()
+        elif self.loopMode == 1 and self.queue.empty():
+            # Start over from the beginning of the history
+            self.queue.rewind()
         return await self.queue.get()
 
-    def peek_next(self):
-        """Returns the next track without removing it from the queue."""
-        if self.loopMode == 2 and self.queue._queue[0] is not None:
-            # if we're looping the track, return the first item in the queue
-            return self.queue._queue[0]
-        elif self.loopMode == 1 and self.queue.empty() and not self.history.empty():
-            return self.history._queue[0]
+    def _next_index(self):
+        """Index in queue.tracks of the track that will play next, or None."""
+        if self.loopMode == 2 and self.nowPlaying is not None:
+            return self.queue.cursor - 1
         elif not self.queue.empty():
-            return self.queue.peek()
+            return self.queue.cursor
+        elif self.loopMode == 1 and self.queue.history_length():
+            return 0
         return None
 
-    async def _activate_next_track(self):
-        nextTrack = self.peek_next()
-        if nextTrack is not None and isinstance(nextTrack, QueuedTrack):
-            activated = await nextTrack.to_active_track(loop=self._bot.loop)
-            self.queue._queue[0] = activated
+    def peek_next(self):
+        """Returns the next track without removing it from the queue."""
+        index = self._next_index()
+        return self.queue.tracks[index] if index is not None else None
+
+    def _upcoming_indices(self, count: int):
+        """Indices in queue.tracks of the next count tracks to play, in order."""
+        index = self._next_index()
+        if index is None or self.loopMode == 2:
+            return [] if index is None else [index]
+        indices = []
+        while index is not None and len(indices) < count and index not in indices:
+            indices.append(index)
+            index += 1
+            if index >= len(self.queue.tracks):
+                index = 0 if self.loopMode == 1 else None
+        return indices
+
+    async def _prepare_upcoming(self):
+        """Resolve the streams of upcoming tracks, and start caching their audio if the audio
+        cache is on (otherwise, only the next track is resolved)."""
+        count = audioCache.prefetchCount if audioCache.enabled else 1
+        for index in self._upcoming_indices(max(count, 1)):
+            nextTrack = self.queue.tracks[index]
+            if not isinstance(nextTrack, ActiveTrack):
+                activated = await nextTrack.to_active_track(
+                    loop=self._bot.loop, group=self.guild.id
+                )
+                # the queue might have been edited in the meantime
+                if (
+                    index >= len(self.queue.tracks)
+                    or self.queue.tracks[index] is not nextTrack
+                ):
+                    continue
+                self.queue.tracks[index] = nextTrack = activated
+            if not nextTrack.is_stale():
+                nextTrack.stream.prefetch()
 
     def _has_empty_next(self):
         """Will an added track be up next/play immediately or not?"""
@@ -154,17 +768,141 @@ class GuildQueue:
     async def add(self, track: QueuedTrack):
         await self.queue.put(track)
 
-    async def add_url(self, ctx, url: str):
-        tracks = await QueuedTrack.from_url(
-            ctx, url, self._has_empty_next(), loop=self._bot.loop
+    async def add_url(self, ctx, url: str, position: int | None = None):
+        """Queue a URL. For playlists, only the first track is queued before returning; the rest
+        are loaded in batches in the background (see PlaylistLoader.task).
+
+        Args:
+            position (int, optional): Where to insert the tracks (0 is next up). Defaults to the end.
+
+        Returns:
+            tuple: The tracks queued so far, and the PlaylistLoader or None.
+        """
+        playsNext = position == 0 or self._has_empty_next()
+        tracks, loader = await QueuedTrack.stream_url(
+            ctx, url, playsNext, loop=self._bot.loop
+        )
+        if position is None:
+            index = None
+            self.queue.insert_many(len(self.queue), tracks)
+        else:
+            # an absolute index, so it isn't thrown off by the cursor moving while we load
+            index = self.queue.cursor + min(position, len(self.queue))
+            self.queue.insert_many(index - self.queue.cursor, tracks)
+            index += len(tracks)
+        if loader is not None:
+            self.loaders.add(loader)
+            loader.task = self._bot.loop.create_task(self._load_playlist(loader, index))
+        return tracks, loader
+
+    def add_urls(self, ctx, urls: list[str], position: int | None = None) -> BulkLoader:
+        """Queue several URLs (or searches) in the order given, in the background (see
+        BulkLoader.task). They're resolved a few at a time in parallel, and each is queued as
+        soon as everything before it has been, so the first can start playing while the rest
+        load. Playlists are streamed in like add_url's, before the next URL's tracks.
+
+        Args:
+            urls (list[str])
+            position (int, optional): Where to insert the tracks (0 is next up). Defaults to the end.
+        """
+        playsNext = position == 0 or self._has_empty_next()
+        if position is None:
+            position = len(self.queue)
+        # absolute, like add_url's
+        index = self.queue.cursor + min(position, len(self.queue))
+        bulk = BulkLoader(urls)
+        self.loaders.add(bulk)
+        bulk.task = self._bot.loop.create_task(
+            self._load_urls(ctx, bulk, index, playsNext)
         )
+        return bulk
+
+    async def _load_urls(self, ctx, bulk: BulkLoader, index: int, plays_next: bool):
+        limit = asyncio.Semaphore(self.bulkConcurrency)
+
+        async def resolve(url: str, active: bool):
+            async with limit:
+                return await QueuedTrack.stream_url(
+                    ctx, url, active, loop=self._bot.loop
+                )
+
+        tasks = [
+            self._bot.loop.create_task(resolve(url, plays_next and i == 0))
+            for i, url in enumerate(bulk.queries)
+        ]
+        try:
+            for task in tasks:
+                try:
+                    tracks, loader = await task
+                except Exception as e:
+                    bulk.results.append(e)
+                    continue
+                index = max(index, self.queue.cursor)
+                self.queue.insert_many(index - self.queue.cursor, tracks)
+                index += len(tracks)
+                bulk.results.append((tracks, loader))
+                if loader is not None:
+                    self.loaders.add(loader)
+                    loader.task = self._bot.loop.create_task(
+                        self._load_playlist(loader, index)
+                    )
+                    index = await loader.task
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.loaders.discard(bulk)
+
+    async def _load_playlist(self, loader: PlaylistLoader, index: int | None = None):
+        """Queue the rest of the playlist, at index if given. Returns where it ended."""
+        try:
+            while not loader.done:
+                batch = await loader.next_batch()
+                if index is None:
+                    self.queue.insert_many(len(self.queue), batch)
+                else:
+                    index = max(index, self.queue.cursor)
+                    self.queue.insert_many(index - self.queue.cursor, batch)
+                    index += len(batch)
+        except Exception as e:
+            loader.error = e
+            self._bot.logger.warning(
+                f"Stopped loading playlist {loader.title} after {loader.loaded} tracks: {e}"
+            )
+        finally:
+            self.loaders.discard(loader)
+        return index
+
+    def snapshot(self) -> dict:
+        """The player's state, for QueueStore. The playing track is saved as the next one up."""
+        client = self.guild.voice_client
+        playing = self.nowPlaying is not None
+        return {
+            "channel": self.channel.id,
+            "voice_channel": client.channel.id if client else None,
+            "cursor": self.queue.cursor - 1 if playing else self.queue.cursor,
+            "position": int(self.progress()) if playing else 0,
+            "loop_mode": self.loopMode,
+            "volume": self.volume,
+        }
+
+    def restore(self, state: dict, tracks: list[QueuedTrack]):
+        """Load a snapshot into an empty player. It resumes near where it left off."""
         for track in tracks:
-            await self.queue.put(track)
-        return tracks
-
-    def np_embed(self):
-        return self.nowPlaying.to_embed(progress=self.progress(), playing=True)
+            self.queue.put_nowait(track)
+        self.queue.cursor = min(state["cursor"], len(self.queue.tracks))
+        self.loopMode = state["loop_mode"]
+        self.volume = state["volume"]
+        self.resumeAt = state["position"]
+        # play the saved track, rather than replaying the one before it if it's looping
+        self._skipping = True
 
     async def cleanup(self):
-        await self.guild.voice_client.disconnect()
+        for loader in list(self.loaders):
+            loader.task.cancel()
         self.task.cancel()
+        if self.panel is not None:
+            await self.panel.close()
+        if self.nowPlaying is not None:
+            self.nowPlaying.cleanup()
+        if self.guild.voice_client:
+            await self.guild.voice_client.disconnect()
@@ -0,0 +1,155 @@
+import asyncio
+import traceback
+from collections import deque
+
+import aiohttp
+import discord
+
+from utils.logs import logger
+
+# Discord's limits for one webhook message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+
+
+def error_key(error: BaseException) -> str:
+    """Identifies errors with the same type and stack, whatever their messages say."""
+    error = getattr(error, "original", None) or error
+    frames = traceback.extract_tb(error.__traceback__)
+    return "|".join(
+        [type(error).__qualname__]
+        + [f"{f.filename}:{f.lineno}:{f.name}" for f in frames]
+    )
+
+
+class WebhookReporter:
+    def __init__(self, url: str | None, window: float = 60, max_queue: int = 100):
+        """Sends embeds to a webhook from one background task, over one pooled session.
+
+        Queued embeds are sent up to ten at a time. Reports with the same key within window
+        seconds of the first are only counted, and sent as one summary when the window's over,
+        so an error storm costs a couple of messages per distinct error. The webhook adapter
+        waits out rate limits, and with a single sender nothing piles on while it does.
+
+        Args:
+            url (str, optional): The webhook's URL. Without one, reports are dropped.
+            window (float): Seconds to group reports with the same key for. Defaults to 60.
+            max_queue (int): Embeds waiting to be sent before more are dropped. Defaults to 100.
+        """
+        self.url = url
+        self.window = window
+        self.maxQueue = max_queue
+        self._pending: deque[discord.Embed] = deque()
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()  # nothing's waiting to be sent
+        self._idle.set()
+        self._groups: dict[str, list] = {}  # key: [first embed, repeats]
+        self._session: aiohttp.ClientSession | None = None
+        self._task: asyncio.Task | None = None
+
+        self.sent = 0  # messages
+        self.grouped = 0  # reports folded into a summary
+        self.dropped = 0  # reports that didn't fit in the queue
+
+    @property
+    def enabled(self):
+        return bool(self.url)
+
+    def report(self, embed: discord.Embed, key: str | None = None) -> bool:
+        """Queue an embed to send. Returns whether it was accepted (or grouped).
+
+        Args:
+            embed (discord.Embed)
+            key (str, optional): Reports with the same key are grouped, like error_key(error).
+        """
+        if not self.enabled:
+            return False
+        if key is not None:
+            group = self._groups.get(key)
+            if group is not None:
+                group[1] += 1
+                self.grouped += 1
+                return True
+            self._groups[key] = [embed, 0]
+            asyncio.get_running_loop().call_later(self.window, self._summarize, key)
+        return self._enqueue(embed)
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "grouped": self.grouped,
+            "dropped": self.dropped,
+            "queued": len(self._pending),
+        }
+
+    async def close(self, timeout: float = 5):
+        """Send the summaries and queued reports left (for up to timeout seconds), then stop."""
+        for key in list(self._groups):
+            self._summarize(key)
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._task.cancel()
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _enqueue(self, embed: discord.Embed) -> bool:
+        if len(self._pending) >= self.maxQueue:
+            self.dropped += 1
+            return False
+        self._pending.append(embed)
+        self._idle.clear()
+        self._wake.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._send_loop())
+        return True
+
+    def _summarize(self, key: str):
+        group = self._groups.pop(key, None)
+        if group is None or not group[1]:
+            return
+        embed, repeats = group
+        summary = discord.Embed.from_dict(embed.to_dict())
+        summary.title = f"{embed.title} (×{repeats} more)"
+        summary.add_field(
+            name="Repeats",
+            value=f"Happened {repeats} more times within {self.window:g}s of this one",
+            inline=False,
+        )
+        self._enqueue(summary)
+
+    def _take_batch(self) -> list[discord.Embed]:
+        """As many queued embeds as fit in one message (at least one)."""
+        batch = [self._pending.popleft()]
+        size = len(batch[0])
+        while (
+            self._pending
+            and len(batch) < MAX_EMBEDS
+            and size + len(self._pending[0]) <= MAX_EMBED_CHARS
+        ):
+            size += len(self._pending[0])
+            batch.append(self._pending.popleft())
+        return batch
+
+    async def _send_loop(self):
+        while True:
+            if not self._pending:
+                self._idle.set()
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            batch = self._take_batch()
+            try:
+                if self._session is None:
+                    self._session = aiohttp.ClientSession()
+                webhook = discord.Webhook.from_url(self.url, session=self._session)
+                await webhook.send(embeds=batch)
+                self.sent += 1
+            except Exception as e:
+                logger.warning(
+                    f"Couldn't send {len(batch)} reports to the webhook: {e}"
+                )
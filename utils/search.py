@@ -0,0 +1,193 @@
+import asyncio
+import math
+import re
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+import aiohttp
+
+# Plays lose half their weight in the ranking after this many seconds
+HALF_LIFE = 7 * 24 * 3600
+# Longest a remote search can take before autocomplete answers without it
+REMOTE_TIMEOUT = 1.5
+# Wait this long for the user to stop typing before searching remotely
+DEBOUNCE = 0.3
+# Discord shows at most this many choices
+MAX_CHOICES = 25
+
+SUGGEST_URL = "https://suggestqueries.google.com/complete/search"
+
+
+def tokenize(text: str) -> list[str]:
+    return re.findall(r"\w+", text.casefold())
+
+
+class TitleIndex:
+    def __init__(self, max_entries: int = 2000):
+        """An in-memory prefix index of played track titles, ranked by how often and how
+        recently they were played.
+
+        Every word of a query has to start a word of the title, so "rick nev" finds "Never Gonna
+        Give You Up - Rick Astley". The least valuable entries are dropped past max_entries.
+        """
+        self.maxEntries = max_entries
+        self.entries: dict[str, list] = {}  # url: [title, score, scored at]
+        self._postings: dict[str, set[str]] = {}  # word: urls
+        self._words: list[
+            str
+        ] | None = []  # sorted, rebuilt when words are added or removed
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, title: str, url: str, now: float | None = None):
+        """Count a play of the track."""
+        now = now or time.time()
+        entry = self.entries.get(url)
+        if entry is None:
+            if len(self.entries) >= self.maxEntries:
+                self._evict(now)
+            self.entries[url] = [title, 1.0, now]
+            for word in set(tokenize(title)):
+                if word not in self._postings:
+                    self._postings[word] = set()
+                    self._words = None
+                self._postings[word].add(url)
+        else:
+            entry[1] = self._score(entry, now) + 1
+            entry[2] = now
+
+    def search(self, query: str, limit: int = MAX_CHOICES, now: float | None = None):
+        """The best (title, url) pairs for a query, best first."""
+        now = now or time.time()
+        words = tokenize(query)
+        if not words:
+            urls = self.entries.keys()
+        else:
+            urls = None
+            for word in words:
+                matches = self._prefixed(word)
+                urls = matches if urls is None else urls & matches
+                if not urls:
+                    return []
+        ranked = sorted(
+            urls, key=lambda url: self._score(self.entries[url], now), reverse=True
+        )
+        return [(self.entries[url][0], url) for url in ranked[:limit]]
+
+    def _prefixed(self, prefix: str) -> set[str]:
+        if self._words is None:
+            self._words = sorted(self._postings)
+        urls = set()
+        for i in range(bisect_left(self._words, prefix), len(self._words)):
+            word = self._words[i]
+            if not word.startswith(prefix):
+                break
+            urls |= self._postings[word]
+        return urls
+
+    def _score(self, entry, now):
+        _, score, scoredAt = entry
+        return score * math.pow(0.5, (now - scoredAt) / HALF_LIFE)
+
+    def _evict(self, now):
+        # drop the lowest scoring tenth in one go, so this isn't paid on every add
+        ranked = sorted(
+            self.entries, key=lambda url: self._score(self.entries[url], now)
+        )
+        for url in ranked[: max(len(ranked) // 10, 1)]:
+            title = self.entries.pop(url)[0]
+            for word in set(tokenize(title)):
+                postings = self._postings[word]
+                postings.discard(url)
+                if not postings:
+                    del self._postings[word]
+                    self._words = None
+
+
+class PlayedIndex:
+    def __init__(self, global_entries: int = 5000, guild_entries: int = 500):
+        """Titles played in each guild, and across every guild, for autocomplete."""
+        self.everywhere = TitleIndex(global_entries)
+        self.guilds: dict[int, TitleIndex] = {}
+        self.guildEntries = guild_entries
+
+    def add(self, guildId: int, title: str, url: str):
+        if not title or not url:
+            return
+        self.everywhere.add(title, url)
+        if guildId not in self.guilds:
+            self.guilds[guildId] = TitleIndex(self.guildEntries)
+        self.guilds[guildId].add(title, url)
+
+    def search(self, guildId: int | None, query: str, limit: int = MAX_CHOICES):
+        """The guild's matches first, then everyone else's, without duplicates."""
+        results = []
+        if guildId in self.guilds:
+            results = self.guilds[guildId].search(query, limit)
+        seen = {url for _, url in results}
+        for title, url in self.everywhere.search(query, limit):
+            if len(results) >= limit:
+                break
+            if url not in seen:
+                results.append((title, url))
+        return results
+
+
+class RemoteSearch:
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        """YouTube search suggestions, debounced per user and cached.
+
+        This asks the suggestion API straight over HTTP instead of going through yt-dlp, so it's
+        fast and never takes a slot in the extraction pool.
+        """
+        self.maxEntries = max_entries
+        self.ttl = ttl
+        self._cache: OrderedDict[str, tuple[float, list[str]]] = OrderedDict()
+        self._latest: dict[int, str] = {}  # user id: their latest query
+        self._session: aiohttp.ClientSession | None = None
+
+    async def suggest(self, userId: int, query: str) -> list[str]:
+        """Suggestions for a query, or [] if the user has typed more since or it's too slow."""
+        query = " ".join(query.split())
+        if not query:
+            return []
+        cached = self._cache.get(query.casefold())
+        if cached is not None and cached[0] > time.time():
+            self._cache.move_to_end(query.casefold())
+            return cached[1]
+
+        self._latest[userId] = query
+        await asyncio.sleep(DEBOUNCE)
+        if self._latest.get(userId) != query:
+            return []
+        del self._latest[userId]
+
+        try:
+            suggestions = await asyncio.wait_for(self._fetch(query), REMOTE_TIMEOUT)
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError):
+            return []
+        self._cache[query.casefold()] = (time.time() + self.ttl, suggestions)
+        if len(self._cache) > self.maxEntries:
+            self._cache.popitem(last=False)
+        return suggestions
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _fetch(self, query: str) -> list[str]:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        async with self._session.get(
+            SUGGEST_URL, params={"client": "firefox", "ds": "yt", "q": query}
+        ) as response:
+            response.raise_for_status()
+            # ["query", ["suggestion", ...]]
+            data = await response.json(content_type=None)
+        return [suggestion for suggestion in data[1] if isinstance(suggestion, str)]
+
+
+playedIndex = PlayedIndex()
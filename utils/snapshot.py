@@ -0,0 +1,91 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueStore:
+    def __init__(self, path: str):
+        """Snapshots of guild queues in a sqlite database, so they survive restarts and crashes.
+
+        Each guild has a row of player state (channels, cursor, loop mode, volume, position) and
+        a row per saved track holding QueuedTrack.to_record(). Tracks keep their index in the
+        queue, but only those from the first one saved on are kept, and the cursor counts from
+        there. Writes go through a single thread, so
+        they land in the order they were made without blocking the event loop.
+
+        Args:
+            path (str): Where to keep the sqlite database.
+        """
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="queue-store")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS guilds (guild_id INTEGER PRIMARY KEY, state TEXT);
+            CREATE TABLE IF NOT EXISTS tracks (
+                guild_id INTEGER, idx INTEGER, record TEXT, PRIMARY KEY (guild_id, idx)
+            );
+            """
+        )
+
+    async def save(
+        self,
+        guildId: int,
+        state: dict,
+        records: list[dict],
+        start: int = 0,
+        first: int = 0,
+    ):
+        """Save a guild's state, replace its tracks from index start on with records, and drop
+        the ones before index first."""
+        await self._run(self._save, guildId, state, records, start, first)
+
+    async def delete(self, guildId: int):
+        await self._run(self._delete, guildId)
+
+    async def load_all(self) -> list[tuple[int, dict, list[dict]]]:
+        """Every saved guild, as (guild id, state, track records)."""
+        return await self._run(self._load_all)
+
+    def close(self):
+        self._executor.shutdown()
+        self._db.close()
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _save(self, guildId, state, records, start, first):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO guilds VALUES (?, ?)",
+                (guildId, json.dumps(state)),
+            )
+            self._db.execute(
+                "DELETE FROM tracks WHERE guild_id = ? AND (idx >= ? OR idx < ?)",
+                (guildId, start, first),
+            )
+            self._db.executemany(
+                "INSERT INTO tracks VALUES (?, ?, ?)",
+                (
+                    (guildId, i, json.dumps(record))
+                    for i, record in enumerate(records, start)
+                ),
+            )
+
+    def _delete(self, guildId):
+        with self._db:
+            self._db.execute("DELETE FROM guilds WHERE guild_id = ?", (guildId,))
+            self._db.execute("DELETE FROM tracks WHERE guild_id = ?", (guildId,))
+
+    def _load_all(self):
+        saved = []
+        for guildId, state in self._db.execute("SELECT * FROM guilds").fetchall():
+            records = [
+                json.loads(record)
+                for (record,) in self._db.execute(
+                    "SELECT record FROM tracks WHERE guild_id = ? ORDER BY idx",
+                    (guildId,),
+                )
+            ]
+            saved.append((guildId, json.loads(state), records))
+        return saved
@@ -0,0 +1,327 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discord
+
+from utils.queue import GuildQueue
+from utils.snapshot import QueueStore
+from utils.track import QueuedTrack
+
+# Longest wait between restarts of a player loop that keeps crashing
+MAX_RESTART_DELAY = 60
+# Give up on a player after this many crashes in a row
+MAX_RESTARTS = 5
+# A loop that ran this long before crashing resets the crash count
+HEALTHY_RUNTIME = 60
+
+
+class PlayerSupervisor:
+    def __init__(
+        self,
+        bot,
+        idle_timeout: float = 300,
+        paused_timeout: float = 3600,
+        alone_timeout: float = 60,
+        sweep_interval: float = 15,
+        snapshot_path: str | None = None,
+        snapshot_interval: float = 10,
+    ):
+        """Owns every guild's GuildQueue and tears down the ones nobody's using.
+
+        Players are disconnected and freed once nothing has played for idle_timeout seconds (or
+        paused_timeout, if a track is paused), or once nobody else has been in the voice channel
+        for alone_timeout seconds. Player loops that crash are restarted with exponential backoff.
+
+        Args:
+            bot (commands.Bot)
+            idle_timeout (float): Seconds a player can sit without playing anything. Defaults to 300.
+            paused_timeout (float): Seconds a track can stay paused. Defaults to 3600.
+            alone_timeout (float): Seconds a player can play to an empty channel. Defaults to 60.
+            sweep_interval (float): Seconds between checks. Defaults to 15.
+            snapshot_path (str, optional): sqlite database to save queues to, so they're picked
+                back up after a restart or crash. Defaults to not saving them.
+            snapshot_interval (float): Seconds between snapshots. Defaults to 10.
+        """
+        self.bot = bot
+        self.idleTimeout = idle_timeout
+        self.pausedTimeout = paused_timeout
+        self.aloneTimeout = alone_timeout
+        self.sweepInterval = sweep_interval
+
+        self.players: dict[int, GuildQueue] = {}
+        self.restarts = 0  # total, for stats
+        self._idleSince: dict[int, float] = {}
+        self._aloneSince: dict[int, float] = {}
+        self._crashes: dict[int, int] = {}
+        self._startedAt: dict[int, float] = {}
+        self.task = bot.loop.create_task(self._sweep_loop())
+
+        self.store = QueueStore(snapshot_path) if snapshot_path else None
+        self.snapshotInterval = snapshot_interval
+        # guild id: (queue revision, track count, first track saved) as of the last snapshot
+        self._saved: dict[int, tuple[int, int, int]] = {}
+        self._savedState: dict[int, dict] = {}
+        self.snapshotTask = (
+            bot.loop.create_task(self._snapshot_loop()) if self.store else None
+        )
+
+    def get(self, ctx) -> GuildQueue:
+        """Get the guild's player, or make a new one."""
+        try:
+            return self.players[ctx.guild.id]
+        except KeyError:
+            pass
+        player = GuildQueue(ctx)
+        self.players[ctx.guild.id] = player
+        self._watch(player)
+        return player
+
+    async def stop(self, guildId: int, reason: str | None = None, forget: bool = True):
+        """Disconnect and free a guild's player, optionally telling its channel why.
+
+        Unless forget is False, its snapshot is deleted too, so it isn't restored later.
+        """
+        player = self.players.pop(guildId, None)
+        self._idleSince.pop(guildId, None)
+        self._aloneSince.pop(guildId, None)
+        self._crashes.pop(guildId, None)
+        self._startedAt.pop(guildId, None)
+        self._saved.pop(guildId, None)
+        self._savedState.pop(guildId, None)
+        if self.store and forget:
+            await self.store.delete(guildId)
+        if player is None:
+            return
+        await player.cleanup()
+        if reason:
+            try:
+                await player.channel.send(reason)
+            except discord.HTTPException:
+                pass
+
+    async def close(self):
+        self.task.cancel()
+        if self.store:
+            self.snapshotTask.cancel()
+            await self.snapshot()
+        for guildId in list(self.players):
+            # keep the snapshots, so the players come back when we do
+            await self.stop(guildId, forget=False)
+        if self.store:
+            self.store.close()
+
+    def stats(self) -> dict:
+        return {
+            "players": len(self.players),
+            "playing": sum(1 for p in self.players.values() if not p.is_idle()),
+            "restarts": self.restarts,
+        }
+
+    def _watch(self, player: GuildQueue):
+        self._startedAt[player.guild.id] = time.monotonic()
+        player.task.add_done_callback(lambda task: self._on_exit(player, task))
+
+    def _on_exit(self, player: GuildQueue, task: asyncio.Task):
+        guildId = player.guild.id
+        if (
+            task.cancelled()
+            or self.bot.is_closed()
+            or self.players.get(guildId) is not player
+        ):
+            return
+        error = task.exception()
+        self.bot.logger.error(
+            f"Player loop for guild {guildId} stopped",
+            exc_info=(type(error), error, error.__traceback__) if error else None,
+        )
+
+        if time.monotonic() - self._startedAt.get(guildId, 0) > HEALTHY_RUNTIME:
+            self._crashes[guildId] = 0
+        crashes = self._crashes.get(guildId, 0) + 1
+        self._crashes[guildId] = crashes
+        if crashes > MAX_RESTARTS:
+            self.bot.loop.create_task(
+                self.stop(guildId, "The player kept crashing, so I've stopped it 😵")
+            )
+            return
+        delay = min(2 ** (crashes - 1), MAX_RESTART_DELAY)
+        self.bot.loop.create_task(self._restart(player, delay))
+
+    async def _restart(self, player: GuildQueue, delay: float):
+        await asyncio.sleep(delay)
+        if self.players.get(player.guild.id) is not player:
+            return
+        self.restarts += 1
+        player.start()
+        self._watch(player)
+
+    async def _sweep_loop(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.sweepInterval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.bot.logger.error("Player sweep failed", exc_info=e)
+
+    async def sweep(self):
+        """Tear down players that are disconnected, idle, or alone."""
+        now = time.monotonic()
+        for guildId, player in list(self.players.items()):
+            client = player.guild.voice_client
+            if client is None or not client.is_connected():
+                await self.stop(guildId)
+                continue
+
+            idleSince = aloneSince = now
+            if player.is_idle():
+                idleSince = self._idleSince.setdefault(guildId, now)
+            else:
+                self._idleSince.pop(guildId, None)
+            if all(member.bot for member in client.channel.members):
+                aloneSince = self._aloneSince.setdefault(guildId, now)
+            else:
+                self._aloneSince.pop(guildId, None)
+
+            if now - aloneSince >= self.aloneTimeout:
+                await self.stop(
+                    guildId, "Left the voice channel since nobody's listening 👋"
+                )
+            elif now - idleSince >= (
+                self.pausedTimeout if player.is_paused() else self.idleTimeout
+            ):
+                await self.stop(
+                    guildId, "Left the voice channel since nothing's playing 👋"
+                )
+
+    async def _snapshot_loop(self):
+        await self.bot.wait_until_ready()
+        try:
+            await self.restore()
+        except Exception as e:
+            self.bot.logger.error("Restoring saved queues failed", exc_info=e)
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.snapshotInterval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                self.bot.logger.error("Saving queues failed", exc_info=e)
+
+    async def snapshot(self):
+        """Save every player that's changed since the last snapshot.
+
+        Only the tracks from the cursor on are kept, since played ones won't be played again
+        (unless the whole queue is looping, when they're kept too). Tracks are only rewritten if
+        the queue was edited; if tracks were just added to the end, only those are written.
+        """
+        for guildId, player in list(self.players.items()):
+            if self.players.get(guildId) is not player:
+                # stopped while we were saving another player
+                continue
+            try:
+                await self._save_player(guildId, player)
+            except Exception as e:
+                # the others can still be saved, and this one is tried again next time
+                self.bot.logger.error(
+                    f"Saving the queue in guild {guildId} failed", exc_info=e
+                )
+
+    async def _save_player(self, guildId: int, player: GuildQueue):
+        state = player.snapshot()
+        tracks = player.queue.tracks
+        first = 0 if state["loop_mode"] == 1 else state["cursor"]
+        current = (player.queue.revision, len(tracks), first)
+        saved = self._saved.get(guildId)
+        if saved == current and self._savedState.get(guildId) == state:
+            return
+        if (
+            saved
+            and saved[0] == current[0]
+            and saved[1] <= current[1]
+            and saved[2] <= first
+        ):
+            # appended to, or played further; tracks before first are dropped
+            start = max(saved[1], first)
+        else:
+            start = first
+        records = [track.to_record() for track in tracks.slice(start, current[1])]
+        # the saved tracks start at first
+        stored = dict(state, cursor=state["cursor"] - first)
+        await self.store.save(guildId, stored, records, start, first)
+        # only once it's written, so a failed save is retried in full next time
+        if self.players.get(guildId) is player:
+            self._saved[guildId] = current
+            self._savedState[guildId] = state
+
+    async def restore(self):
+        """Bring back the players saved before the last shutdown or crash."""
+        for guildId, state, records in await self.store.load_all():
+            guild = self.bot.get_guild(guildId)
+            if guild is None:
+                if self._owns(guildId):
+                    # we've been removed from it
+                    await self.store.delete(guildId)
+                # otherwise another cluster has it
+                continue
+            try:
+                restored = await self._restore_player(guild, state, records)
+            except Exception as e:
+                self.bot.logger.warning(
+                    f"Couldn't restore player in guild {guildId}: {e}"
+                )
+                restored = False
+            if not restored:
+                await self.store.delete(guildId)
+
+    async def _restore_player(
+        self, guild: discord.Guild, state: dict, records: list[dict]
+    ):
+        channel = guild.get_channel(state["channel"])
+        voiceChannel = guild.get_channel(state["voice_channel"] or 0)
+        if (
+            guild.id in self.players
+            or channel is None
+            or voiceChannel is None
+            or state["cursor"] >= len(records)
+            or all(member.bot for member in voiceChannel.members)
+        ):
+            return False
+
+        requesters = {}
+        for memberId in {record["requester"] for record in records}:
+            member = guild.get_member(memberId)
+            if member is None:
+                try:
+                    member = await guild.fetch_member(memberId)
+                except discord.NotFound:
+                    # they've left, so credit ourselves
+                    member = guild.me
+            requesters[memberId] = member
+        tracks = [
+            QueuedTrack.from_record(record, requesters[record["requester"]])
+            for record in records
+        ]
+
+        if guild.voice_client is None:
+            await voiceChannel.connect()
+        ctx = SimpleNamespace(
+            bot=self.bot, guild=guild, channel=channel, cog=self.bot.get_cog("MusicCog")
+        )
+        player = self.get(ctx)
+        player.restore(state, tracks)
+        # the restored queue is numbered from 0 again, unlike its saved rows, so it's left
+        # out of _saved and the first snapshot rewrites it in full
+        self.bot.logger.info(
+            f"Restored player in guild {guild.id} with {len(tracks)} tracks"
+        )
+        try:
+            await channel.send("I'm back! Picking up where I left off 🎶")
+        except discord.HTTPException:
+            pass
+        return True
+
+    def _owns(self, guildId: int) -> bool:
+        """Is the guild on one of our shards?"""
+        shardIds = self.bot.shard_ids or range(self.bot.shard_count or 1)
+        return (guildId >> 22) % (self.bot.shard_count or 1) in shardIds
@@ -1,6 +1,18 @@
 import discord
-from yt_dlp import YoutubeDL
+from discord.ext import commands
 import asyncio
+import re
+import time
+from contextlib import contextmanager
+from itertools import chain, islice, tee
+from urllib.parse import parse_qs, urlsplit
+
+from utils.audio import FrameCounter, RampingVolume
+from utils.audiocache import AudioCache, cache_name
+from utils.cache import MetadataCache, cache_key
+from utils.extractor import ExtractionPool
+from utils.logs import logger, traceId
+from utils.metrics import Histogram, extractInfoSeconds, processInfoSeconds
 
 
 YTDL_OPTIONS = {
@@ -20,10 +32,143 @@ FFMPEG_OPTIONS = {
     "options": "-vn",
 }
 
-ytdlp = YoutubeDL(YTDL_OPTIONS)
+# Local files from the audio cache don't need reconnecting
+FFMPEG_LOCAL_OPTIONS = {
+    "before_options": "-nostdin",
+    "options": "-vn",
+}
+
+# How long to trust a stream URL that doesn't say when it expires
+STREAM_LIFETIME = 3600
+# Re-resolve streams this many seconds before they'd expire mid-track
+STREAM_EXPIRY_MARGIN = 60
+
+# How many playlist entries to load per extraction job
+PLAYLIST_BATCH_SIZE = 100
+
+extractionPool = ExtractionPool(YTDL_OPTIONS)
+metadataCache = MetadataCache()
+audioCache = AudioCache()
+
+
+@contextmanager
+def timed(histogram: Histogram, what: str):
+    """Observe how many seconds the with block takes, and log how long what took."""
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        took = time.perf_counter() - start
+        histogram.observe(took)
+        logger.info(f"{what} {'failed after' if failed else 'took'} {took:.2f}s")
+
+
+def extract_flat(ytdl, url: str):
+    """Blocking. Get the unprocessed info for a URL or search, from the cache if possible.
+
+    Returns (data, cached). Uncached playlist entries are left as yt-dlp's lazy generator, so
+    they're cached by PlaylistLoader once it's paged all the way through.
+    """
+    key = cache_key(url)
+    data = metadataCache.get(key)
+    if data is not None:
+        return data, True
+    with timed(extractInfoSeconds, f"Extracting {url}"):
+        data = ytdl.extract_info(url, process=False, download=False)
+        if data.get("_type") == "url" and key.startswith("search:"):
+            # plain words come back as a reference to a search (see default_search)
+            data = ytdl.extract_info(
+                data["url"], process=False, download=False, ie_key=data.get("ie_key")
+            )
+    if "entries" not in data:
+        metadataCache.put(key, data)
+        # tracks look themselves up by page URL when they're activated (see QueuedTrack.info)
+        pageKey = cache_key(data.get("webpage_url") or url)
+        if pageKey != key:
+            metadataCache.put(pageKey, data)
+    return data, False
+
+
+def process_info(ytdl, data):
+    """Blocking. Resolve the stream (and everything else) for a flat entry."""
+    with timed(processInfoSeconds, f"Resolving the stream for {data.get('url')}"):
+        return ytdl.process_ie_result(data, download=False)
+
+
+def extract_info(ytdl, url: str):
+    """Blocking. Fully extract a URL, uncached."""
+    with timed(extractInfoSeconds, f"Resolving the stream for {url}"):
+        return ytdl.extract_info(url, download=False)
+
+
+def is_search(data) -> bool:
+    """Is the info a search's results, like ytsearch:'s, rather than a real playlist?"""
+    return (data.get("extractor_key") or "").endswith("Search")
+
+
+def split_playlist(data):
+    """Take a playlist's entries out of its info, and the first entry off of those.
+
+    Returns (entries iterator, first entry), or (None, None) if data isn't a playlist. A search
+    with a single result isn't a playlist either, so that's (None, the result).
+    """
+    if "entries" not in data:
+        return None, None
+    entries = iter(data.pop("entries"))
+    first = next((entry for entry in entries if entry), None)
+    if first is not None and is_search(data):
+        # plain searches ask for one result; only ones like ytsearch5: get more
+        second = next((entry for entry in entries if entry), None)
+        if second is None:
+            return None, first
+        entries = chain([second], entries)
+    return entries, first
+
+
+def open_flat(ytdl, url: str):
+    """Blocking. extract_flat, then split_playlist on the same worker (generators page lazily).
+
+    Returns (data, cached, entries, first entry, worker) so paging can continue on that worker.
+    Cached entries are already in memory, so there's no worker for those.
+    """
+    data, cached = extract_flat(ytdl, url)
+    entries, first = split_playlist(data)
+    if entries is None and first is not None and not cached:
+        # a search's one result; playlists are cached by PlaylistLoader once they're paged
+        metadataCache.put(cache_key(url), dict(data, entries=[first]))
+    worker = None if cached else extractionPool.current_worker()
+    return data, cached, entries, first, worker
+
+
+def fork_flat(result, n: int):
+    """Split an open_flat result between n callers that shared it (see ExtractionPool.run_shared).
+
+    Each gets its own copy of the playlist's entries; they're all paged on the same worker, so
+    the copies are only ever advanced from that thread. Only the first caller caches the
+    playlist once it's loaded.
+    """
+    data, cached, entries, first, worker = result
+    if entries is None:
+        return [result] * n
+    return [
+        (data, cached or i > 0, copy, first, worker)
+        for i, copy in enumerate(tee(entries, n))
+    ]
 
 
 class QueuedTrack:
+    __slots__ = (
+        "title",
+        "web_url",
+        "duration",
+        "thumbnail",
+        "requester",
+        "ieKey",
+        "trace",
+    )
+
     def __init__(
         self,
         *,
@@ -31,15 +176,62 @@ class QueuedTrack:
         requester,
         web_url=None,
     ):
-        self.data = data
-
+        """A queued track. Only what's needed to show it and resolve it again is kept from data;
+        the full yt-dlp info (formats, thumbnails, etc.) is dropped, and fetched again by
+        info() when the track's stream is needed.
+        """
         self.title = data.get("title")
         self.web_url = web_url or data.get(
             "webpage_url"
         )  # NOT a streaming url. link to the video page
         self.duration = data.get("duration")  # in seconds
         self.thumbnail = data.get("thumbnail")
-        self.requester = requester
+        self.requester = requester  # the guild's shared Member, so just a reference
+        self.ieKey = data.get("ie_key") or data.get("extractor_key")
+        self.trace = (
+            traceId.get()
+        )  # of the command that queued it, to log its playback under
+
+    @property
+    def requesterId(self) -> int:
+        return self.requester.id
+
+    def info(self) -> dict:
+        """Blocking. Info to resolve the track's stream from: the cached info if there is any,
+        or else a reference to its page for yt-dlp to extract again."""
+        data = metadataCache.get(cache_key(self.web_url))
+        if data is not None and "entries" not in data:
+            return data
+        return {
+            "_type": "url",
+            "url": self.web_url,
+            "ie_key": self.ieKey,
+            "title": self.title,
+            "duration": self.duration,
+            "thumbnail": self.thumbnail,
+        }
+
+    def stream_key(self) -> str:
+        """Resolving the stream of any track with the same key gives the same result, so
+        concurrent resolutions can share a job."""
+        return "stream:" + cache_key(self.web_url)
+
+    def to_record(self) -> dict:
+        """The few fields needed to queue this track again later, without the yt-dlp info."""
+        return {
+            "url": self.web_url,
+            "ie_key": self.ieKey,
+            "title": self.title,
+            "duration": self.duration,
+            "thumbnail": self.thumbnail,
+            "requester": self.requesterId,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict, requester):
+        """Queue a track saved with to_record. Its stream is resolved from the page when it's
+        activated, like a playlist entry's."""
+        return cls(data=record, requester=requester, web_url=record["url"])
 
     @classmethod
     async def from_url(
@@ -51,44 +243,88 @@ class QueuedTrack:
         loop=None,
     ):
         """Return an array of QueuedTracks from the given URL (with the first being Active if active is true)."""
+        tracks, loader = await cls.stream_url(ctx, url, active, loop=loop)
+        if loader is not None:
+            tracks += await loader.load_all()
+        return tracks
+
+    @classmethod
+    async def stream_url(
+        cls,
+        ctx: discord.ApplicationContext,
+        url: str,
+        active: bool = False,
+        *,
+        loop=None,
+    ):
+        """Like from_url, but only the first entry of a playlist is loaded before returning.
+
+        Returns:
+            tuple: The first QueuedTrack (Active if active is true) in a list, and a PlaylistLoader
+            for the rest of the playlist, or None if the URL wasn't a playlist.
+        """
         loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(
-            None,
-            lambda: ytdlp.extract_info(url, process=False, download=False),
-        )
+        group = ctx.guild.id if ctx.guild else None
+        key = cache_key(url)
+        data = metadataCache.get(key, disk=False)
+        if data is not None:
+            # answering from memory doesn't need to wait for a worker
+            cached, worker = True, None
+            entries, first = split_playlist(data)
+        else:
+            # everyone playing the same link at once shares one extraction
+            data, cached, entries, first, worker = await extractionPool.run_shared(
+                "flat:" + key,
+                lambda ytdl: open_flat(ytdl, url),
+                group=group,
+                fork=fork_flat,
+            )
 
-        if "entries" in data:
-            tracks = []
-            for entry in data["entries"]:
-                # each entry has only its video page url, thumbnail + other info you'd get from the playlist overview- no streaming url.
-                tracks.append(
-                    cls(data=entry, requester=ctx.author, web_url=entry["url"])
+        if entries is None:
+            if first is not None:
+                # a search's result
+                track = cls(data=first, requester=ctx.author, web_url=first["url"])
+            else:
+                track = cls(
+                    data=data, requester=ctx.author, web_url=data["webpage_url"]
                 )
-
             if active:
-                tracks[0] = await tracks[0].to_active_track(loop=loop)
-
-            return tracks
+                track = await track.to_active_track(loop=loop, group=group)
+            return [track], None
 
-        track = cls(data=data, requester=ctx.author, web_url=data["webpage_url"])
+        if first is None:
+            raise commands.UserInputError("That playlist is empty")
 
+        # each entry has only its video page url, thumbnail + other info you'd get from the playlist overview- no streaming url.
+        track = cls(data=first, requester=ctx.author, web_url=first["url"])
         if active:
-            return [await track.to_active_track(loop=loop)]
-        else:
-            return [track]
+            track = await track.to_active_track(loop=loop, group=group)
+        loader = PlaylistLoader(
+            data,
+            entries,
+            requester=ctx.author,
+            first=first,
+            key=None if cached else key,
+            group=group,
+            worker=worker,
+        )
+        return [track], loader
 
-    async def to_active_track(self, loop=None):
-        # TODO: if we queued an individual song + are activating it 6+ hours later, does that mean we need to refresh the streaming urls?
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(
-            None, lambda: ytdlp.process_ie_result(self.data, download=False)
+    async def to_active_track(self, loop=None, group=None):
+        """Resolve the stream for this track. No audio is opened until ActiveTrack.open."""
+        data = await extractionPool.run_shared(
+            self.stream_key(),
+            lambda ytdl: process_info(ytdl, self.info()),
+            group=group,
         )
-        return ActiveTrack(
-            discord.FFmpegPCMAudio(data["url"], **FFMPEG_OPTIONS),
+        track = ActiveTrack(
+            StreamInfo(data),
             data=data,
             requester=self.requester,
             web_url=self.web_url,
         )
+        track.trace = self.trace
+        return track
 
     def pretty_duration(self, time=None):
         if time is None:
@@ -123,15 +359,216 @@ class QueuedTrack:
         )
 
 
-class ActiveTrack(discord.PCMVolumeTransformer, QueuedTrack):
+class PlaylistLoader:
+    def __init__(
+        self,
+        data,
+        entries,
+        *,
+        requester,
+        first,
+        key=None,
+        group=None,
+        worker=None,
+    ):
+        """Pages through the rest of a playlist after its first entry has been queued.
+
+        Args:
+            data (dict): The playlist's flat info, without its entries.
+            entries: An iterator over the remaining entries.
+            requester (discord.Member): Who queued the playlist.
+            first (dict): The entry that was already taken off the iterator.
+            key (str, optional): Cache key to store the whole playlist under once it's loaded.
+            group: Extraction pool group to page in.
+            worker (int, optional): Extraction worker that owns a lazy entries generator. If None,
+                the entries are already in memory and are read without the pool.
+        """
+        self.title = data.get("title")
+        self.total = data.get("playlist_count")  # None if the playlist doesn't say
+        self.loaded = 1
+        self.done = False
+        self.error: Exception | None = None
+        self.task: asyncio.Task | None = None  # set by whoever's loading it
+        self.requester = requester
+        self._data = data
+        self._entries = entries
+        self._seen = [first] if key else None
+        self._key = key
+        self._group = group
+        self._worker = worker
+
+    async def next_batch(self, size: int = PLAYLIST_BATCH_SIZE) -> list[QueuedTrack]:
+        """Load up to size more tracks. Returns an empty list once the playlist is done."""
+        if self.done:
+            return []
+        if self._worker is None:
+            entries = list(islice(self._entries, size))
+        else:
+            entries = await extractionPool.run(
+                lambda ytdl: list(islice(self._entries, size)),
+                group=self._group,
+                worker=self._worker,
+            )
+
+        if self._seen is not None:
+            self._seen.extend(entries)
+        if len(entries) < size:
+            self.done = True
+            if self._seen is not None:
+                data = dict(self._data, entries=self._seen)
+                self._seen = None
+                await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: metadataCache.put(self._key, data)
+                )
+
+        tracks = [
+            QueuedTrack(data=entry, requester=self.requester, web_url=entry["url"])
+            for entry in entries
+            if entry
+        ]
+        self.loaded += len(tracks)
+        return tracks
+
+    async def load_all(self) -> list[QueuedTrack]:
+        tracks = []
+        while not self.done:
+            tracks += await self.next_batch()
+        return tracks
+
+
+class StreamInfo:
+    __slots__ = ("url", "codec", "headers", "cacheName", "resolvedAt", "expires")
+
+    def __init__(self, data):
+        """A resolved stream URL and when it stops working.
+
+        Args:
+            data (dict): A processed yt-dlp info dict.
+        """
+        self.url: str = data["url"]
+        self.codec: str | None = data.get("acodec")
+        self.headers: dict = data.get("http_headers") or {}
+        self.cacheName = cache_name(data)
+        self.resolvedAt = time.time()
+        self.expires = stream_expiry(self.url) or self.resolvedAt + STREAM_LIFETIME
+
+    def is_stale(self, duration=None):
+        """Will the URL expire before a track of the given length could finish playing?"""
+        return time.time() + (duration or 0) + STREAM_EXPIRY_MARGIN >= self.expires
+
+    def is_opus(self):
+        """Is the audio already Opus, so it can be sent to Discord without re-encoding?"""
+        return self.codec == "opus"
+
+    def cached_path(self) -> str | None:
+        """The local copy of the audio in the audio cache, if there is one."""
+        return audioCache.get(self.cacheName) if self.cacheName else None
+
+    def prefetch(self):
+        """Start downloading the audio into the audio cache, if it's enabled."""
+        if self.cacheName:
+            audioCache.prefetch(self.cacheName, self.url, self.headers)
+
+
+def stream_expiry(url: str) -> float | None:
+    """Read the expiry timestamp signed into a stream URL, like googlevideo's expire= parameter."""
+    parts = urlsplit(url)
+    expire = parse_qs(parts.query).get("expire")
+    if expire and expire[0].isdigit():
+        return float(expire[0])
+    # manifest URLs put their parameters in the path instead
+    match = re.search(r"/expire/(\d+)", parts.path)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class ActiveTrack(QueuedTrack):
+    __slots__ = ("stream", "source")
+
     def __init__(
         self,
-        source,
+        stream: StreamInfo,
         *,
         data,
         requester,
-        volume=1.0,
         web_url=None,
     ):
-        super().__init__(source, volume)
-        QueuedTrack.__init__(self, data=data, requester=requester)
+        """A track with a resolved stream, ready to be opened and played. Like QueuedTrack, only
+        the stream's details are kept from data."""
+        QueuedTrack.__init__(self, data=data, requester=requester, web_url=web_url)
+        self.stream = stream
+        self.source: FrameCounter | None = None
+
+    def is_stale(self):
+        """Does the stream need resolving again before playing? Never if it's cached locally."""
+        return self.stream.is_stale(self.duration) and self.stream.cached_path() is None
+
+    async def refresh(self, group=None):
+        """Resolve a fresh stream URL from the track's page."""
+        data = await extractionPool.run_shared(
+            self.stream_key(),
+            lambda ytdl: extract_info(ytdl, self.web_url),
+            group=group,
+        )
+        self.stream = StreamInfo(data)
+
+    def open(self, volume=1.0, passthrough=True, start: float = 0, on_start=None):
+        """Start FFmpeg and return an audio source for the voice client. Call right before playing.
+
+        The local copy from the audio cache is used if there is one. If passthrough is
+        allowed, the stream is already Opus and the volume doesn't need
+        changing, FFmpeg just remuxes the Opus packets. Otherwise it decodes to PCM, and the
+        volume is applied and the audio re-encoded in this process.
+
+        Args:
+            volume (float): Volume to play at. Defaults to 1.0.
+            passthrough (bool): Whether Opus passthrough is allowed. Defaults to True.
+            start (float): Where to start playing from, in seconds. Defaults to 0.
+            on_start (callable, optional): Called from the player thread when the first audio
+                packet is read.
+        """
+        self.cleanup()
+        self.source = self.new_source(volume, passthrough, start, on_start)
+        return self.source
+
+    def new_source(self, volume=1.0, passthrough=True, start: float = 0, on_start=None):
+        """Like open, but leaves the track's own source alone, for opening the track again
+        before its current source has finished playing (see GuildQueue's handoffs)."""
+        path = self.stream.cached_path()
+        options = dict(FFMPEG_OPTIONS if path is None else FFMPEG_LOCAL_OPTIONS)
+        path = path or self.stream.url
+        if start > 0:
+            options["before_options"] += f" -ss {start:.2f}"
+        if self.can_passthrough(volume, passthrough):
+            # py-cord only copies the stream when told it's already Opus; "copy" re-encodes
+            source = discord.FFmpegOpusAudio(path, codec=self.stream.codec, **options)
+        else:
+            source = RampingVolume(discord.FFmpegPCMAudio(path, **options), volume)
+        return FrameCounter(source, start, on_start)
+
+    def reopen(self, volume=1.0, passthrough=True, start: float = 0) -> FrameCounter:
+        """Open a new source while the current one is still playing, and return it. The old
+        one is left to whoever's playing it, to clean up once they've switched over."""
+        self.source = self.new_source(volume, passthrough, start)
+        return self.source
+
+    def can_passthrough(self, volume=1.0, passthrough=True):
+        return passthrough and volume == 1.0 and self.stream.is_opus()
+
+    def is_passthrough(self):
+        return self.source is not None and self.source.is_opus()
+
+    def set_volume(self, volume: float):
+        """Change the volume of a PCM source (passthrough sources have to be reopened)."""
+        self.source.original.volume = volume
+
+    def position(self) -> float:
+        """Seconds into the track, counted from the audio actually played."""
+        return self.source.position if self.source is not None else 0
+
+    def cleanup(self):
+        """Stop FFmpeg if it's running. The track can be opened again later."""
+        if self.source is not None:
+            self.source.cleanup()
+            self.source = None
@@ -1,4 +1,19 @@
-def chunks(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+import math
+
+
+def parse_time(text: str) -> float:
+    """Parse a time like 90, 1:30 or 1:02:03 into seconds."""
+    parts = text.strip().split(":")
+    if len(parts) > 3:
+        raise ValueError(f"{text} isn't a time")
+    seconds = 0.0
+    for part in parts:
+        try:
+            value = float(part)
+        except ValueError:
+            raise ValueError(f"{text} isn't a time") from None
+        # float() also takes nan and inf
+        if value < 0 or not math.isfinite(value):
+            raise ValueError(f"{text} isn't a time")
+        seconds = seconds * 60 + value
+    return seconds
@@ -36,3 +36,106 @@ class LinkButtons(discord.ui.View):
             item.disabled = True
         if self.message:
             await self.message.edit(view=self)
+
+
+class PageView(discord.ui.View):
+    def __init__(
+        self,
+        ctx: commands.Context,
+        render,
+        page_count,
+        timeout: int | None = 180,
+    ):
+        """A View that flips through pages, rendering only the one being shown.
+
+        Usage:
+            view = PageView(ctx, render=lambda page: discord.Embed(title=f"Page {page + 1}"), page_count=lambda: 10)
+            await view.respond()
+
+        Args:
+            ctx (commands.Context)
+            render (callable): Takes a page number (starting at 0) and returns its discord.Embed.
+            page_count (callable): Returns how many pages there are right now.
+            timeout (int): The amount of time to wait before disabling the buttons. Defaults to 180.
+        """
+        super().__init__(timeout=timeout)
+        self.ctx = ctx
+        self.render = render
+        self.page_count = page_count
+        self.page = 0
+        self.message: discord.Message | None = None
+        self.children: list[discord.ui.Button]
+
+    async def respond(self, **kwargs):
+        """Send the first page. kwargs are passed on to ctx.respond, like silent=True."""
+        self._update_buttons()
+        response = await self.ctx.respond(
+            embed=self.render(self.page), view=self, **kwargs
+        )
+        if isinstance(response, discord.Interaction):
+            response = await response.original_response()
+        self.message = response
+
+    async def show(self, interaction: discord.Interaction, page: int):
+        self.page = max(0, min(page, self.page_count() - 1))
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.render(self.page), view=self)
+
+    def _update_buttons(self):
+        last = self.page_count() - 1
+        self.first.disabled = self.previous.disabled = self.page <= 0
+        self.next.disabled = self.last.disabled = self.page >= last
+        self.jump.label = f"{self.page + 1}/{last + 1}"
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user == self.ctx.author
+
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.blurple)
+    async def first(self, button, interaction):
+        await self.show(interaction, 0)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.blurple)
+    async def previous(self, button, interaction):
+        await self.show(interaction, self.page - 1)
+
+    @discord.ui.button(label="1/1", style=discord.ButtonStyle.gray)
+    async def jump(self, button, interaction):
+        await interaction.response.send_modal(JumpModal(self))
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.blurple)
+    async def next(self, button, interaction):
+        await self.show(interaction, self.page + 1)
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.blurple)
+    async def last(self, button, interaction):
+        await self.show(interaction, self.page_count() - 1)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            await self.message.edit(view=self)
+
+
+class JumpModal(discord.ui.Modal):
+    def __init__(self, view: PageView):
+        """Asks which page a PageView should jump to."""
+        super().__init__(title="Jump to page")
+        self.view = view
+        self.add_item(
+            discord.ui.InputText(
+                label=f"Page (1-{view.page_count()})",
+                placeholder=str(view.page + 1),
+                max_length=6,
+            )
+        )
+
+    async def callback(self, interaction: discord.Interaction):
+        try:
+            page = int(self.children[0].value) - 1
+        except ValueError:
+            await interaction.response.send_message(
+                "That's not a page number", ephemeral=True
+            )
+            return
+        await self.view.show(interaction, page)
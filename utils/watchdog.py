@@ -0,0 +1,107 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from utils.metrics import loopLagSeconds
+
+
+class LoopWatchdog:
+    def __init__(self, loop, logger, threshold: float = 0.25, interval: float = 0.1):
+        """Watches the event loop from another thread and logs what's blocking it.
+
+        The loop bumps a heartbeat every interval seconds. If the heartbeat is ever more than
+        threshold seconds late, the watchdog thread logs the stack the loop's thread is stuck
+        in, while it's still stuck. How late each heartbeat runs is also the loop lag metric.
+
+        Args:
+            loop (asyncio.AbstractEventLoop)
+            logger (logging.Logger)
+            threshold (float): Seconds the loop can block before it's reported. Defaults to 0.25.
+            interval (float): Seconds between heartbeats. Defaults to 0.1.
+        """
+        self.loop = loop
+        self.logger = logger
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = 0  # total, for stats
+        self.lastBeat = time.monotonic()
+        self._loopThread: int | None = None
+        self._handle = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+
+    def start(self):
+        """Start watching. Call from the loop's thread."""
+        self._loopThread = threading.get_ident()
+        self.lastBeat = time.monotonic()
+        self._handle = self.loop.call_later(self.interval, self._beat)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+
+    def _beat(self):
+        now = time.monotonic()
+        lag = max(now - self.lastBeat - self.interval, 0)
+        loopLagSeconds.observe(lag)
+        if lag > self.threshold:
+            self.logger.warning(f"Event loop was blocked for {lag:.3f}s")
+        self.lastBeat = now
+        self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.interval):
+            lastBeat = self.lastBeat
+            blockedFor = time.monotonic() - lastBeat - self.interval
+            if blockedFor < self.threshold or reported == lastBeat:
+                continue
+            # once per stall
+            reported = lastBeat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loopThread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(unknown)\n"
+            self.logger.warning(
+                f"Event loop blocked for {blockedFor:.3f}s so far, in:\n{stack.rstrip()}"
+            )
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def sample_profile(threadId: int, duration: float, interval: float = 0.005):
+    """Blocking. Sample a thread's stack every interval seconds for duration seconds.
+
+    Returns:
+        tuple: How many samples were taken, a Counter of how often each function was the one
+        running, and a Counter of how often each function was anywhere on the stack.
+    """
+    own, total = Counter(), Counter()
+    samples = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        frame = sys._current_frames().get(threadId)
+        if frame is not None:
+            samples += 1
+            own[frame_name(frame)] += 1
+            # count recursive functions once per sample
+            seen = set()
+            while frame is not None:
+                name = frame_name(frame)
+                if name not in seen:
+                    seen.add(name)
+                    total[name] += 1
+                frame = frame.f_back
+        time.sleep(interval)
+    return samples, own, total